@@ -0,0 +1,92 @@
+"""Сессия Bot без сети и фабрика синтетических апдейтов."""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, AsyncGenerator, Optional
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiogram.types import CallbackQuery, Chat, Message, Update, User
+
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+
+class FakeSession(BaseSession):
+    """Отвечает на запросы Bot API сразу (или через latency секунд), ничего не отправляя.
+
+    Ответ проходит через тот же разбор JSON, что и настоящий, поэтому
+    хендлеры получают обычные объекты Message.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1)
+
+    def _result(self, method: TelegramMethod) -> Any:
+        returning = method.__returning__
+        if returning is User:
+            return BOT_USER
+        if returning is Message:
+            return {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": getattr(method, "chat_id", 0), "type": "private"},
+                "text": getattr(method, "text", None),
+            }
+        # bool и Union[Message, bool] (редактирование сообщений)
+        return True
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None):
+        self.calls[method.__api_method__] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        content = json.dumps({"ok": True, "result": self._result(method)})
+        response = self.check_response(bot=bot, method=method, status_code=200, content=content)
+        return response.result
+
+    async def stream_content(self, url: str, headers: Optional[dict] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class UpdateFactory:
+    """Синтетические апдейты от имени пользователей с id user_id."""
+
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> User:
+        return User(id=user_id, is_bot=False, first_name=f"user{user_id}")
+
+    def _message(self, user_id: int, text: Optional[str], from_bot: bool = False) -> Message:
+        return Message(
+            message_id=next(self._message_ids),
+            date=datetime.now(),
+            chat=Chat(id=user_id, type="private"),
+            from_user=User(**BOT_USER) if from_bot else self._user(user_id),
+            text=text,
+        )
+
+    def message(self, user_id: int, text: str) -> Update:
+        return Update(update_id=next(self._update_ids), message=self._message(user_id, text))
+
+    def callback(self, user_id: int, data: str) -> Update:
+        update_id = next(self._update_ids)
+        return Update(update_id=update_id, callback_query=CallbackQuery(
+            id=str(update_id),
+            from_user=self._user(user_id),
+            chat_instance="bench",
+            data=data,
+            message=self._message(user_id, "bench", from_bot=True),
+        ))
@@ -0,0 +1,234 @@
+"""Нагрузочный прогон настоящих хендлеров бота без сети.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --scenario purchase --users 500 --stock 10 --concurrency 200
+    python -m benchmarks.run --provider-latency 0.3 --telegram-latency 0.05
+
+Синтетические апдейты подаются в настоящий Dispatcher с роутерами бота.
+Telegram заменен FakeSession, YooKassa, CryptoBot и API курса валют —
+локальными заглушками, база — временным файлом SQLite. Для каждого
+сценария печатается пропускная способность (апдейтов в секунду) и
+p50/p99 времени обработки по хендлерам.
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+from aiogram import BaseMiddleware
+
+from benchmarks.fake_bot import FakeSession, UpdateFactory
+from benchmarks.stub_providers import StubProviders
+
+
+SCENARIOS = ("start", "catalog", "topup", "purchase")
+FIRST_USER_ID = 100_000
+USER_BALANCE = 1000
+PRODUCT_PRICE = 5
+PAGES_PER_USER = 3
+
+# Конфиг читается при импорте, поэтому окружение выставляется до импорта бота
+BENCH_ENV = {
+    "BOT_TOKEN": "123456:bench",
+    "ADMIN_IDS": "",
+    "YOOKASSA_SHOP_ID": "bench",
+    "YOOKASSA_SECRET_KEY": "bench",
+    "CRYPTO_API_KEY": "bench",
+    "EXCHANGE_API_KEY": "bench",
+    "TELEGRAM_API_URL": "",
+    "PAYMENT_WEBHOOKS": "false",
+    "METRICS_PORT": "0",
+}
+
+
+class TimingMiddleware(BaseMiddleware):
+    """Точное время каждого апдейта по хендлерам (гистограмм метрик для p99 мало)."""
+
+    def __init__(self):
+        self.timings = defaultdict(list)
+        self.errors = 0
+
+    def reset(self):
+        self.timings.clear()
+        self.errors = 0
+
+    async def __call__(self, handler, event, data):
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            # Имя хендлера записывает middleware метрик (monitoring.middleware)
+            timing = data.get("metrics_timing")
+            self.timings[timing.handler if timing else "unhandled"].append(time.perf_counter() - started)
+
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[max(math.ceil(q * len(values)) - 1, 0)]
+
+
+# --- Сценарии: список "сессий", каждая — апдейты одного пользователя по порядку ---
+
+def start_scenario(factory: UpdateFactory, users: list, product_ids: list, stock_ids: list) -> list:
+    return [[factory.message(user_id, "/start")] for user_id in users]
+
+
+def catalog_scenario(factory: UpdateFactory, users: list, product_ids: list, stock_ids: list) -> list:
+    sessions = []
+    for user_id in users:
+        updates = [factory.message(user_id, "📜 Товары")]
+        for _ in range(PAGES_PER_USER):
+            updates.append(factory.callback(user_id, f"page_n_{random.choice(product_ids)}_"))
+        updates.append(factory.callback(user_id, f"product_{random.choice(product_ids)}"))
+        updates.append(factory.callback(user_id, "products_back"))
+        sessions.append(updates)
+    return sessions
+
+
+def topup_scenario(factory: UpdateFactory, users: list, product_ids: list, stock_ids: list) -> list:
+    return [[
+        factory.callback(user_id, "topup_yoo"),
+        factory.message(user_id, "500"),
+        factory.callback(user_id, "topup_crypto"),
+        factory.message(user_id, "5"),
+    ] for user_id in users]
+
+
+def purchase_scenario(factory: UpdateFactory, users: list, product_ids: list, stock_ids: list) -> list:
+    # Много покупателей на маленький остаток: проверяем конкуренцию за товар и баланс
+    return [[factory.callback(user_id, f"buy_{random.choice(stock_ids)}")] for user_id in users]
+
+
+SCENARIO_BUILDERS = {
+    "start": start_scenario,
+    "catalog": catalog_scenario,
+    "topup": topup_scenario,
+    "purchase": purchase_scenario,
+}
+
+
+# --- Прогон ---
+
+async def seed(users: list, products: int) -> list:
+    from database.db import db
+    from functions.ledger import SOURCE_ADMIN, post_entry, to_cents
+    from functions.product_import import import_products
+
+    def add_users(conn):
+        conn.executemany("INSERT OR IGNORE INTO users (telegram_id) VALUES (?)", [(u,) for u in users])
+        for user_id in users:
+            post_entry(conn, user_id, to_cents(USER_BALANCE), SOURCE_ADMIN)
+
+    await db.transaction(add_users)
+    lines = (f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}:root:pw{i}:2:4:50:NL:{PRODUCT_PRICE}" for i in range(products))
+    result = await import_products(lines)
+    result.cleanup()
+    return [row[0] for row in await db.fetchall("SELECT id FROM products ORDER BY id")]
+
+
+async def run_sessions(dp, bot, sessions: list, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_session(updates):
+        async with semaphore:
+            for update in updates:
+                try:
+                    await dp.feed_update(bot, update)
+                except Exception:
+                    pass  # учтено в TimingMiddleware
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(updates) for updates in sessions))
+    return time.perf_counter() - started
+
+
+def report(name: str, elapsed: float, timing: TimingMiddleware, extra: str = ""):
+    total = sum(len(values) for values in timing.timings.values())
+    print(f"\n{name}: {total} апдейтов за {elapsed:.2f} с — {total / elapsed:.0f} апд/с, ошибок: {timing.errors}{extra}")
+    print(f"  {'хендлер':<28} {'кол-во':>8} {'p50, мс':>9} {'p99, мс':>9}")
+    for handler, values in sorted(timing.timings.items()):
+        print(f"  {handler:<28} {len(values):>8} {percentile(values, 0.5) * 1000:>9.2f} {percentile(values, 0.99) * 1000:>9.2f}")
+
+
+async def bench(args):
+    from database.db import db
+    from main import create_app
+    from monitoring.log import setup_logging
+    from payments.currency import rate_cache
+
+    setup_logging()
+
+    session = FakeSession(args.telegram_latency)
+    bot, dp = create_app(background_tasks=False, session=session)
+    timing = TimingMiddleware()
+    dp.update.outer_middleware(timing)
+
+    workflow_data = {"dispatcher": dp, "bots": [bot], "bot": bot, **dp.workflow_data}
+    await dp.emit_startup(**workflow_data)
+    try:
+        await rate_cache.refresh()
+        users = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+        product_ids = await seed(users, args.products)
+        stock_ids = product_ids[:args.stock]
+        factory = UpdateFactory()
+
+        for name in args.scenario or SCENARIOS:
+            sessions = SCENARIO_BUILDERS[name](factory, users, product_ids, stock_ids)
+            timing.reset()
+            sold_before = (await db.fetchone("SELECT COUNT(*) FROM purchases"))[0]
+            elapsed = await run_sessions(dp, bot, sessions, args.concurrency)
+            extra = ""
+            if name == "purchase":
+                sold = (await db.fetchone("SELECT COUNT(*) FROM purchases"))[0] - sold_before
+                extra = f", продано: {sold} из {len(stock_ids)}"
+            report(name, elapsed, timing, extra)
+        print(f"\nЗапросов к Bot API: {sum(session.calls.values())}")
+    finally:
+        await dp.emit_shutdown(**workflow_data)
+        await bot.session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="сценарий (можно несколько; по умолчанию все)")
+    parser.add_argument("--users", type=int, default=200, help="число пользователей")
+    parser.add_argument("--products", type=int, default=5000, help="товаров в каталоге")
+    parser.add_argument("--stock", type=int, default=20, help="товаров, за которые идет борьба в сценарии purchase")
+    parser.add_argument("--concurrency", type=int, default=50, help="пользователей, обрабатываемых одновременно")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--provider-latency", type=float, default=0.05, help="задержка ответа платежных провайдеров, с")
+    parser.add_argument("--db", help="файл БД (по умолчанию — временный)")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--seed", type=int, default=1, help="seed для случайного выбора страниц и товаров")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    providers = StubProviders(args.provider_latency)
+    providers.start()
+    tmp_dir = None
+    if args.db is None:
+        tmp_dir = tempfile.mkdtemp(prefix="bench_")
+        args.db = os.path.join(tmp_dir, "bench.db")
+    os.environ.update(BENCH_ENV)
+    os.environ.update(providers.env())
+    os.environ["DB_PATH"] = args.db
+    os.environ["LOG_LEVEL"] = args.log_level
+    try:
+        asyncio.run(bench(args))
+    finally:
+        providers.stop()
+        if tmp_dir is not None:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"Запросов к заглушкам провайдеров: {providers.requests}")
+
+
+if __name__ == "__main__":
+    main()
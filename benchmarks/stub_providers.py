@@ -0,0 +1,134 @@
+"""Локальные заглушки YooKassa, CryptoBot и API курса валют для нагрузочных прогонов.
+
+Работают в отдельном потоке со своим event loop, чтобы обработка запросов
+заглушками не отнимала время у измеряемого бота.
+"""
+import asyncio
+import itertools
+import threading
+import uuid
+from typing import Optional
+
+from aiohttp import web
+
+
+USD_PER_RUB = 0.011
+
+
+class StubProviders:
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1"):
+        self.latency = latency
+        self.host = host
+        self.port: Optional[int] = None
+        self.requests = 0
+        self._payments: dict[str, dict] = {}
+        self._invoices: dict[int, dict] = {}
+        self._invoice_ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def env(self) -> dict:
+        """Переменные окружения, направляющие клиенты провайдеров на заглушки."""
+        return {
+            "YOOKASSA_API_URL": f"{self.base_url}/yookassa",
+            "CRYPTOBOT_API_URL": f"{self.base_url}/cryptobot",
+            "EXCHANGE_API_URL": f"{self.base_url}/exchange",
+        }
+
+    async def _delay(self):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def create_payment(self, request: web.Request) -> web.Response:
+        await self._delay()
+        body = await request.json()
+        payment_id = str(uuid.uuid4())
+        payment = {
+            "id": payment_id,
+            "status": "pending",
+            "amount": body["amount"],
+            "confirmation": {"type": "redirect", "confirmation_url": f"{self.base_url}/pay/{payment_id}"},
+            "metadata": body.get("metadata") or {},
+        }
+        self._payments[payment_id] = payment
+        return web.json_response(payment)
+
+    async def get_payment(self, request: web.Request) -> web.Response:
+        await self._delay()
+        payment = self._payments.get(request.match_info["payment_id"])
+        if payment is None:
+            return web.json_response({"type": "error", "description": "not found"}, status=404)
+        return web.json_response(payment)
+
+    async def create_invoice(self, request: web.Request) -> web.Response:
+        await self._delay()
+        body = await request.json()
+        invoice_id = next(self._invoice_ids)
+        invoice = {
+            "invoice_id": invoice_id,
+            "status": "active",
+            "amount": str(body["amount"]),
+            "pay_url": f"{self.base_url}/invoice/{invoice_id}",
+            "payload": body.get("payload"),
+        }
+        self._invoices[invoice_id] = invoice
+        return web.json_response({"ok": True, "result": invoice})
+
+    async def get_invoices(self, request: web.Request) -> web.Response:
+        await self._delay()
+        ids = request.query.get("invoice_ids")
+        if ids:
+            items = [self._invoices[int(x)] for x in ids.split(",") if int(x) in self._invoices]
+        else:
+            items = list(self._invoices.values())
+        return web.json_response({"ok": True, "result": {"items": items}})
+
+    async def exchange_rate(self, request: web.Request) -> web.Response:
+        await self._delay()
+        return web.json_response({"result": "success", "conversion_rates": {"USD": USD_PER_RUB}})
+
+    def _app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/yookassa/payments", self.create_payment)
+        app.router.add_get("/yookassa/payments/{payment_id}", self.get_payment)
+        app.router.add_post("/cryptobot/createInvoice", self.create_invoice)
+        app.router.add_get("/cryptobot/getInvoices", self.get_invoices)
+        app.router.add_get("/exchange/{api_key}/latest/RUB", self.exchange_rate)
+        return app
+
+    async def _start(self):
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def start(self):
+        """Запускает заглушки и ждет, пока они начнут принимать запросы."""
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start())
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="stub-providers", daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
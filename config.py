@@ -1,15 +1,18 @@
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 import os
-import logging
+import ipaddress
 
 
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+load_dotenv()
 
 
-load_dotenv()
-logger.debug(f"Переменные окружения: {os.environ.get('BOT_TOKEN')=}, {os.environ.get('RETURN_URL')=}")
+def _parse_pairs(value: str, convert):
+    for item in value.split(','):
+        if "=" in item:
+            name, _, raw = item.partition("=")
+            yield name.strip(), convert(raw.strip())
+
 
 class Config(BaseSettings):
     BOT_TOKEN: str = os.getenv("BOT_TOKEN")
@@ -19,6 +22,76 @@ class Config(BaseSettings):
     RETURN_URL: str = os.getenv("RETURN_URL", "https://t.me/thezovotestbot")
     EXCHANGE_API_KEY : str = os.getenv("EXCHANGE_API_KEY")
     CRYPTO_API_KEY : str = os.getenv("CRYPTO_API_KEY")
+    DB_PATH: str = os.getenv("DB_PATH", "vds_shop.db")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", 4))
+    YOOKASSA_API_URL: str = os.getenv("YOOKASSA_API_URL", "https://api.yookassa.ru/v3")
+    YOOKASSA_TIMEOUT: float = float(os.getenv("YOOKASSA_TIMEOUT", 10))
+    YOOKASSA_CONCURRENCY: int = int(os.getenv("YOOKASSA_CONCURRENCY", 20))
+    CRYPTOBOT_API_URL: str = os.getenv("CRYPTOBOT_API_URL", "https://pay.crypt.bot/api")
+    CRYPTOBOT_TIMEOUT: float = float(os.getenv("CRYPTOBOT_TIMEOUT", 10))
+    CRYPTOBOT_CONCURRENCY: int = int(os.getenv("CRYPTOBOT_CONCURRENCY", 10))
+    EXCHANGE_API_URL: str = os.getenv("EXCHANGE_API_URL", "https://v6.exchangerate-api.com/v6")
+    EXCHANGE_TIMEOUT: float = float(os.getenv("EXCHANGE_TIMEOUT", 5))
+    EXCHANGE_CONCURRENCY: int = int(os.getenv("EXCHANGE_CONCURRENCY", 2))
+    EXCHANGE_RATE_TTL: float = float(os.getenv("EXCHANGE_RATE_TTL", 3600))
+    RECONCILE_INTERVAL: float = float(os.getenv("RECONCILE_INTERVAL", 60))
+    RECONCILE_BATCH_SIZE: int = int(os.getenv("RECONCILE_BATCH_SIZE", 100))
+    RECONCILE_CONCURRENCY: int = int(os.getenv("RECONCILE_CONCURRENCY", 5))
+    BOT_MODE: str = os.getenv("BOT_MODE", "polling")  # polling | webhook
+    WEBHOOK_BASE_URL: str = os.getenv("WEBHOOK_BASE_URL", "")
+    WEBHOOK_PATH: str = os.getenv("WEBHOOK_PATH", "/webhook/telegram")
+    WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
+    WEBHOOK_HOST: str = os.getenv("WEBHOOK_HOST", "127.0.0.1")
+    WEBHOOK_PORT: int = int(os.getenv("WEBHOOK_PORT", 8080))
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", 1))
+    WEBHOOK_TRUST_PROXY: bool = os.getenv("WEBHOOK_TRUST_PROXY", "false").lower() == "true"
+    WEBHOOK_PROXY_IP_HEADER: str = os.getenv("WEBHOOK_PROXY_IP_HEADER", "X-Forwarded-For")
+    PAYMENT_WEBHOOKS: bool = os.getenv("PAYMENT_WEBHOOKS", "false").lower() == "true"
+    YOOKASSA_WEBHOOK_PATH: str = os.getenv("YOOKASSA_WEBHOOK_PATH", "/webhook/yookassa")
+    CRYPTOBOT_WEBHOOK_PATH: str = os.getenv("CRYPTOBOT_WEBHOOK_PATH", "/webhook/cryptobot")
+    YOOKASSA_WEBHOOK_IPS: str = os.getenv(
+        "YOOKASSA_WEBHOOK_IPS",
+        "185.71.76.0/27,185.71.77.0/27,77.75.153.0/25,77.75.156.11,77.75.156.35,77.75.154.128/25,2a02:5180::/32"
+    )
+    YOOKASSA_WEBHOOK_REFETCH: bool = os.getenv("YOOKASSA_WEBHOOK_REFETCH", "true").lower() == "true"
+    RECONCILE_WEBHOOK_INTERVAL: float = float(os.getenv("RECONCILE_WEBHOOK_INTERVAL", 900))
+    BROADCAST_RATE: float = float(os.getenv("BROADCAST_RATE", 28))
+    BROADCAST_CONCURRENCY: int = int(os.getenv("BROADCAST_CONCURRENCY", 20))
+    BROADCAST_CHUNK_SIZE: int = int(os.getenv("BROADCAST_CHUNK_SIZE", 200))
+    BROADCAST_LEASE_TIMEOUT: float = float(os.getenv("BROADCAST_LEASE_TIMEOUT", 60))
+    FSM_STATE_TTL: float = float(os.getenv("FSM_STATE_TTL", 86400))
+    FSM_CLEANUP_INTERVAL: float = float(os.getenv("FSM_CLEANUP_INTERVAL", 3600))
+    CATALOG_SYNC_INTERVAL: float = float(os.getenv("CATALOG_SYNC_INTERVAL", 1))
+    CATALOG_CHANGES_RETENTION: float = float(os.getenv("CATALOG_CHANGES_RETENTION", 3600))
+    PROMO_CACHE_TTL: float = float(os.getenv("PROMO_CACHE_TTL", 30))
+    PROMO_NEGATIVE_TTL: float = float(os.getenv("PROMO_NEGATIVE_TTL", 60))
+    PROMO_GUESS_LIMIT: int = int(os.getenv("PROMO_GUESS_LIMIT", 5))
+    PROMO_GUESS_WINDOW: float = float(os.getenv("PROMO_GUESS_WINDOW", 600))
+    METRICS_HOST: str = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT: int = int(os.getenv("METRICS_PORT", 0))
+    LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_LEVELS: str = os.getenv("LOG_LEVELS", "")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # json | text
+    LOG_SAMPLE: str = os.getenv("LOG_SAMPLE", "aiogram.event=0.1")
+    TELEGRAM_API_URL: str = os.getenv("TELEGRAM_API_URL", "")
+    SUPERVISOR_WORKERS: int = int(os.getenv("SUPERVISOR_WORKERS", os.cpu_count() or 1))
+    SUPERVISOR_HEALTH_INTERVAL: float = float(os.getenv("SUPERVISOR_HEALTH_INTERVAL", 5))
+    SUPERVISOR_HEARTBEAT_TIMEOUT: float = float(os.getenv("SUPERVISOR_HEARTBEAT_TIMEOUT", 60))
+
+    @property
+    def yookassa_webhook_networks(self):
+        """IP-сети, с которых YooKassa присылает уведомления."""
+        return [ipaddress.ip_network(x.strip()) for x in self.YOOKASSA_WEBHOOK_IPS.split(',') if x.strip()]
+
+    @property
+    def log_levels(self):
+        """Уровни отдельных логгеров: "aiogram=WARNING,functions.catalog=DEBUG"."""
+        return dict(_parse_pairs(self.LOG_LEVELS, str.upper))
+
+    @property
+    def log_sample(self):
+        """Доли записей ниже WARNING, которые пишут шумные логгеры: "aiogram.event=0.1"."""
+        return dict(_parse_pairs(self.LOG_SAMPLE, float))
 
     @property
     def admin_ids(self):
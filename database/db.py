@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import queue
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import config
+from monitoring.metrics import db_seconds
+
+
+logger = logging.getLogger(__name__)
+
+
+class Database:
+    """Пул долгоживущих соединений SQLite.
+
+    Все запросы выполняются в отдельном пуле потоков, поэтому event loop
+    aiogram никогда не блокируется на диске.
+    """
+
+    def __init__(self, path: str, pool_size: int = 4):
+        self.path = path
+        self.pool_size = pool_size
+        self._pool: queue.Queue = queue.Queue()
+        self._connections: list[sqlite3.Connection] = []
+        self._executor: ThreadPoolExecutor | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: транзакции открываем явно через transaction()
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        # В режиме WAL читатели каталога не ждут писателей баланса,
+        # а synchronous=NORMAL убирает fsync на каждый коммит
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -16000")
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    def open(self):
+        """Открывает соединения пула (вызывается лениво при первом запросе)."""
+        if self._executor is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="db")
+        for _ in range(self.pool_size):
+            conn = self._connect()
+            self._connections.append(conn)
+            self._pool.put(conn)
+        logger.info("Открыт пул соединений с БД %s (%d шт.)", self.path, self.pool_size)
+
+    async def close(self):
+        if self._executor is None:
+            return
+        self._executor.shutdown(wait=True)
+        for conn in self._connections:
+            conn.close()
+        self._connections.clear()
+        self._pool = queue.Queue()
+        self._executor = None
+
+    def _call(self, fn, *args):
+        conn = self._pool.get()
+        try:
+            return fn(conn, *args)
+        finally:
+            self._pool.put(conn)
+
+    async def _run(self, operation: str, fn, *args):
+        if self._executor is None:
+            self.open()
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, self._call, fn, *args)
+        finally:
+            # Замер на стороне event loop: сюда входит и ожидание свободного соединения
+            db_seconds.observe(time.perf_counter() - started, operation)
+
+    async def run(self, fn, *args):
+        """Выполняет fn(conn, *args) в пуле потоков и возвращает результат."""
+        return await self._run(fn.__name__, fn, *args)
+
+    async def transaction(self, fn, *args):
+        """Выполняет fn(conn, *args) внутри одной транзакции BEGIN IMMEDIATE."""
+        return await self._run(fn.__name__, run_in_transaction, fn, *args)
+
+    async def execute(self, sql: str, params=()) -> int:
+        """Выполняет запрос на запись и возвращает количество затронутых строк."""
+        return await self._run("execute", lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql: str, seq_of_params) -> int:
+        return await self._run(
+            "executemany", run_in_transaction, lambda conn: conn.executemany(sql, seq_of_params).rowcount
+        )
+
+    async def fetchone(self, sql: str, params=()):
+        return await self._run("fetchone", lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params=()):
+        return await self._run("fetchall", lambda conn: conn.execute(sql, params).fetchall())
+
+
+def run_in_transaction(conn: sqlite3.Connection, fn, *args):
+    """Синхронная обертка транзакции для кода, который уже работает в потоке БД."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        result = fn(conn, *args)
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+    return result
+
+
+db = Database(config.DB_PATH, config.DB_POOL_SIZE)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+from database.db import Database
+
+
+logger = logging.getLogger(__name__)
+
+
+def _state_name(state: StateType) -> Optional[str]:
+    return state.state if isinstance(state, State) else state
+
+
+class SQLiteStorage(BaseStorage):
+    """FSM-хранилище aiogram в общей SQLite-базе.
+
+    Состояние и данные лежат в таблице fsm_storage (миграция 8), поэтому
+    переживают перезапуск и одинаково видны всем процессам бота.
+    Записи, не менявшиеся дольше ttl секунд, считаются брошенными: при
+    чтении они игнорируются, а фоновая очистка их удаляет.
+    """
+
+    def __init__(self, database: Database, ttl: float, cleanup_interval: float,
+                 key_builder: Optional[KeyBuilder] = None):
+        self.database = database
+        self.ttl = ttl
+        self.cleanup_interval = cleanup_interval
+        self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+        self._task: Optional[asyncio.Task] = None
+
+    def _key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    def _expired_before(self) -> int:
+        return int(time.time() - self.ttl)
+
+    def _read(self, conn, key):
+        row = conn.execute(
+            "SELECT state, data FROM fsm_storage WHERE key = ? AND updated_at >= ?",
+            (key, self._expired_before())
+        ).fetchone()
+        if row is None:
+            return None, {}
+        return row[0], json.loads(row[1]) if row[1] else {}
+
+    def _write(self, conn, key, state, data):
+        if state is None and not data:
+            # Пустые записи не храним, чтобы таблица не росла от завершенных диалогов
+            conn.execute("DELETE FROM fsm_storage WHERE key = ?", (key,))
+            return
+        conn.execute(
+            """
+            INSERT INTO fsm_storage (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+            """,
+            (key, state, json.dumps(data, ensure_ascii=False) if data else None, int(time.time()))
+        )
+
+    def _set_state(self, conn, key, state):
+        _, data = self._read(conn, key)
+        self._write(conn, key, state, data)
+
+    def _set_data(self, conn, key, data):
+        state, _ = self._read(conn, key)
+        self._write(conn, key, state, data)
+
+    def _update_data(self, conn, key, data):
+        state, current = self._read(conn, key)
+        current.update(data)
+        self._write(conn, key, state, current)
+        return current
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.database.transaction(self._set_state, self._key(key), _state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self.database.run(self._read, self._key(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.database.transaction(self._set_data, self._key(key), dict(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self.database.run(self._read, self._key(key))
+        return data
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        # Чтение и запись в одной транзакции: воркеры не затирают данные друг друга
+        current = await self.database.transaction(self._update_data, self._key(key), dict(data))
+        return current.copy()
+
+    async def cleanup(self) -> int:
+        """Удаляет брошенные состояния. Возвращает число удаленных записей."""
+        return await self.database.execute(
+            "DELETE FROM fsm_storage WHERE updated_at < ?", (self._expired_before(),)
+        )
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.cleanup_interval)
+            try:
+                removed = await self.cleanup()
+                if removed:
+                    logger.info("Удалено брошенных FSM-состояний: %s", removed)
+            except Exception as e:
+                logger.error("Ошибка очистки FSM-хранилища: %s", e)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
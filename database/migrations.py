@@ -0,0 +1,315 @@
+import logging
+
+from database.db import Database
+
+
+logger = logging.getLogger(__name__)
+
+
+def _initial_schema(conn):
+    """Исходная схема бота (бывший create_db)."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER UNIQUE,
+            balance REAL DEFAULT 0,
+            promo_code TEXT DEFAULT NULL
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ip TEXT,
+            login TEXT,
+            password TEXT,
+            cores INTEGER,
+            ram INTEGER,
+            ssd INTEGER,
+            geo TEXT,
+            price REAL
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS purchases (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER,
+            ip TEXT,
+            login TEXT,
+            password TEXT,
+            cores INTEGER,
+            ram INTEGER,
+            ssd INTEGER,
+            geo TEXT,
+            price REAL,
+            purchase_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS promo_codes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE,
+            discount REAL,
+            usage_limit INTEGER
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER,
+            payment_id TEXT UNIQUE,
+            amount_rub REAL,
+            amount_usd REAL,
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS crypto_payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            invoice_id TEXT UNIQUE,
+            telegram_id INTEGER,
+            amount REAL,
+            status TEXT DEFAULT 'pending'
+        )
+    ''')
+
+    # Старые базы создавались без колонки geo
+    columns = [col[1] for col in conn.execute("PRAGMA table_info(products)").fetchall()]
+    if "geo" not in columns:
+        conn.execute("ALTER TABLE products ADD COLUMN geo TEXT DEFAULT 'N/A'")
+
+
+# Миграции применяются строго по возрастанию номера, номер последней
+# примененной хранится в PRAGMA user_version. Уже выпущенные миграции не меняем —
+# только добавляем новые в конец списка.
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "hot-path indexes", [
+        "CREATE INDEX IF NOT EXISTS idx_purchases_telegram_id ON purchases (telegram_id)",
+        "CREATE INDEX IF NOT EXISTS idx_payments_status ON payments (status)",
+        "CREATE INDEX IF NOT EXISTS idx_crypto_payments_status ON crypto_payments (status)",
+        "CREATE INDEX IF NOT EXISTS idx_users_promo_code ON users (promo_code)",
+    ]),
+    (3, "catalog filter indexes", [
+        # Покрывающий индекс для страниц каталога с фильтром по гео:
+        # keyset по id внутри гео, остальные фильтры проверяются прямо в индексе
+        "CREATE INDEX IF NOT EXISTS idx_products_geo_catalog ON products (geo, id, cores, ram, ssd, price)",
+    ]),
+    (4, "exchange rate cache", [
+        """
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            currency TEXT PRIMARY KEY,
+            rate REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+        """,
+    ]),
+    (5, "broadcast jobs", [
+        """
+        CREATE TABLE IF NOT EXISTS broadcasts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL DEFAULT 0,
+            last_user_id INTEGER NOT NULL DEFAULT 0,
+            delivered INTEGER NOT NULL DEFAULT 0,
+            failed INTEGER NOT NULL DEFAULT 0,
+            blocked INTEGER NOT NULL DEFAULT 0,
+            progress_message_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_broadcasts_status ON broadcasts (status)",
+    ]),
+    (6, "product added_at", [
+        # ALTER TABLE не допускает DEFAULT CURRENT_TIMESTAMP, поэтому
+        # дата проставляется явно при вставке, а старые товары получают текущую
+        "ALTER TABLE products ADD COLUMN added_at TIMESTAMP",
+        "UPDATE products SET added_at = CURRENT_TIMESTAMP WHERE added_at IS NULL",
+    ]),
+    (7, "purchase history index", [
+        # История "Мои VDS" листается по (purchase_time, id) внутри пользователя;
+        # rowid хранится в индексе последним столбцом, поэтому сортировка не нужна.
+        # Старый индекс по telegram_id покрывается префиксом нового.
+        "CREATE INDEX IF NOT EXISTS idx_purchases_user_time ON purchases (telegram_id, purchase_time)",
+        "DROP INDEX IF EXISTS idx_purchases_telegram_id",
+    ]),
+    (8, "fsm storage", [
+        """
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage (updated_at)",
+    ]),
+    (9, "catalog change log", [
+        # Журнал удаленных/измененных товаров для кэшей каталога в других процессах.
+        # Новые товары журналировать не нужно: их id всегда больше уже известных.
+        """
+        CREATE TABLE IF NOT EXISTS catalog_changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_id INTEGER NOT NULL,
+            changed_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_products_delete AFTER DELETE ON products
+        BEGIN
+            INSERT INTO catalog_changes (product_id) VALUES (OLD.id);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_products_update AFTER UPDATE ON products
+        BEGIN
+            INSERT INTO catalog_changes (product_id) VALUES (OLD.id);
+        END
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_catalog_changes_changed_at ON catalog_changes (changed_at)",
+    ]),
+    (10, "denormalized user stats", [
+        # Агрегаты для профиля хранятся в строке пользователя и обновляются
+        # в тех же транзакциях, что покупка и зачисление платежа
+        "ALTER TABLE users ADD COLUMN purchase_count INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN total_spent REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN total_topped_up REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN last_purchase_at TIMESTAMP",
+        """
+        UPDATE users SET
+            purchase_count = s.purchase_count,
+            total_spent = s.total_spent,
+            last_purchase_at = s.last_purchase_at
+        FROM (
+            SELECT telegram_id, COUNT(*) AS purchase_count, SUM(price) AS total_spent,
+                   MAX(purchase_time) AS last_purchase_at
+            FROM purchases GROUP BY telegram_id
+        ) AS s
+        WHERE users.telegram_id = s.telegram_id
+        """,
+        """
+        UPDATE users SET total_topped_up = t.amount
+        FROM (
+            SELECT telegram_id, SUM(amount) AS amount FROM (
+                SELECT telegram_id, amount_usd AS amount FROM payments WHERE status = 'succeeded'
+                UNION ALL
+                SELECT telegram_id, amount FROM crypto_payments WHERE status = 'paid'
+            ) GROUP BY telegram_id
+        ) AS t
+        WHERE users.telegram_id = t.telegram_id
+        """,
+    ]),
+    (11, "balance ledger in cents", [
+        # Балансы и агрегаты — в целых центах; users.balance_cents — снимок,
+        # а источник правды — неизменяемый журнал balance_ledger
+        "ALTER TABLE users ADD COLUMN balance_cents INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN total_spent_cents INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE users ADD COLUMN total_topped_up_cents INTEGER NOT NULL DEFAULT 0",
+        """
+        UPDATE users SET
+            balance_cents = CAST(ROUND(COALESCE(balance, 0) * 100) AS INTEGER),
+            total_spent_cents = CAST(ROUND(total_spent * 100) AS INTEGER),
+            total_topped_up_cents = CAST(ROUND(total_topped_up * 100) AS INTEGER)
+        """,
+        "ALTER TABLE users DROP COLUMN balance",
+        "ALTER TABLE users DROP COLUMN total_spent",
+        "ALTER TABLE users DROP COLUMN total_topped_up",
+        """
+        CREATE TABLE IF NOT EXISTS balance_ledger (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            source TEXT NOT NULL CHECK (
+                source IN ('opening', 'purchase', 'topup_yoo', 'topup_crypto', 'admin', 'promo')
+            ),
+            reference TEXT,
+            balance_after_cents INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_balance_ledger_user ON balance_ledger (telegram_id, amount_cents)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_balance_ledger_no_update BEFORE UPDATE ON balance_ledger
+        BEGIN
+            SELECT RAISE(ABORT, 'balance_ledger is append-only');
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_balance_ledger_no_delete BEFORE DELETE ON balance_ledger
+        BEGIN
+            SELECT RAISE(ABORT, 'balance_ledger is append-only');
+        END
+        """,
+        """
+        INSERT INTO balance_ledger (telegram_id, amount_cents, source, balance_after_cents)
+        SELECT telegram_id, balance_cents, 'opening', balance_cents FROM users WHERE balance_cents != 0
+        """,
+    ]),
+    (12, "broadcast leases", [
+        # Рассылку выполняет процесс, который держит аренду: owner и время
+        # последнего продления. Рассылки без владельца свободны
+        "ALTER TABLE broadcasts ADD COLUMN owner TEXT",
+        "ALTER TABLE broadcasts ADD COLUMN heartbeat_at REAL",
+    ]),
+    (13, "promo guess attempts", [
+        # Неудачные попытки ввода промокода общие для всех воркеров: в режиме
+        # webhook апдейты одного пользователя попадают в разные процессы
+        """
+        CREATE TABLE IF NOT EXISTS promo_guesses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            telegram_id INTEGER NOT NULL,
+            attempted_at REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_promo_guesses_user ON promo_guesses (telegram_id, attempted_at)",
+        "CREATE INDEX IF NOT EXISTS idx_promo_guesses_attempted_at ON promo_guesses (attempted_at)",
+    ]),
+]
+
+
+def _apply(conn, version, step):
+    if callable(step):
+        step(conn)
+    else:
+        for sql in step:
+            conn.execute(sql)
+    conn.execute(f"PRAGMA user_version = {int(version)}")
+
+
+def _migrate(conn):
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Несколько процессов могут мигрировать одновременно: версию
+            # перечитываем уже под блокировкой записи
+            current = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version <= current:
+                conn.execute("ROLLBACK")
+                continue
+            _apply(conn, version, step)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        logger.info("Применена миграция %d: %s", version, name)
+        current = version
+
+    conn.execute("PRAGMA optimize")
+    return current
+
+
+async def migrate(database: Database) -> int:
+    """Применяет все недостающие миграции и возвращает текущую версию схемы."""
+    return await database.run(_migrate)
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+from database.db import db
+
+
+logger = logging.getLogger(__name__)
+
+DELIVERED = "delivered"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+class TokenBucket:
+    """Ограничитель скорости: не больше rate отправок в секунду с запасом capacity."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Telegram попросил подождать (RetryAfter) — останавливаем всех отправителей."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class BroadcastJob:
+    id: int
+    admin_id: int
+    text: str
+    total: int
+    last_user_id: int = 0
+    delivered: int = 0
+    failed: int = 0
+    blocked: int = 0
+    progress_message_id: Optional[int] = None
+
+    @property
+    def processed(self) -> int:
+        return self.delivered + self.failed + self.blocked
+
+    def progress_text(self, finished: bool = False) -> str:
+        title = "✅ Рассылка завершена" if finished else "📨 Идет рассылка"
+        return (
+            f"{title} #{self.id}\n"
+            f"Обработано: {self.processed} из {self.total}\n"
+            f"Доставлено: {self.delivered}\n"
+            f"Заблокировали бота: {self.blocked}\n"
+            f"Ошибки: {self.failed}"
+        )
+
+
+class BroadcastManager:
+    """Фоновые рассылки по всем пользователям.
+
+    start() только ставит рассылку в очередь (таблица broadcasts) и может
+    вызываться из любого процесса. Выполняет рассылки один процесс, в котором
+    вызван start_runner(): так все отправки идут через один TokenBucket и
+    общий лимит Telegram не превышается, сколько бы ни было воркеров.
+
+    Рассылку выполняет владелец аренды (owner, heartbeat_at): runner продлевает
+    ее каждые POLL_INTERVAL секунд и забирает только свободные рассылки или те,
+    чей владелец не продлевал аренду дольше lease_timeout. Прогресс пишется
+    только пока аренда своя, поэтому два процесса не шлют одну рассылку.
+
+    Получатели читаются из БД пачками по chunk_size (keyset по users.id),
+    отправка идет параллельно. После каждой пачки прогресс сохраняется,
+    поэтому после рестарта рассылка продолжается с последней сохраненной
+    пачки (сообщения из незавершенной пачки могут уйти повторно).
+    """
+
+    MAX_ATTEMPTS = 3
+    PROGRESS_INTERVAL = 5
+    POLL_INTERVAL = 5
+
+    def __init__(self, bot: Bot, rate: float, concurrency: int, chunk_size: int, lease_timeout: float):
+        self.bot = bot
+        self.chunk_size = chunk_size
+        self.concurrency = concurrency
+        self.lease_timeout = lease_timeout
+        self.bucket = TokenBucket(rate)
+        self.owner = secrets.token_hex(8)
+        self._tasks: dict[int, asyncio.Task] = {}
+        self._runner: Optional[asyncio.Task] = None
+        self._wakeup = asyncio.Event()
+
+    async def start(self, admin_id: int, text: str) -> BroadcastJob:
+        total = (await db.fetchone("SELECT COUNT(*) FROM users"))[0]
+        progress = await self.bot.send_message(admin_id, f"📨 Рассылка запускается, получателей: {total}")
+        job_id = await db.run(lambda conn: conn.execute(
+            "INSERT INTO broadcasts (admin_id, text, total, progress_message_id) VALUES (?, ?, ?, ?)",
+            (admin_id, text, total, progress.message_id)
+        ).lastrowid)
+        # Runner в этом же процессе заберет рассылку сразу, в другом — за POLL_INTERVAL
+        self._wakeup.set()
+        return BroadcastJob(job_id, admin_id, text, total, progress_message_id=progress.message_id)
+
+    def _claim(self, conn, now: float) -> list:
+        return conn.execute('''
+            UPDATE broadcasts SET owner = ?, heartbeat_at = ?
+            WHERE status = 'running' AND (owner IS NULL OR heartbeat_at < ?)
+            RETURNING id, admin_id, text, total, last_user_id, delivered, failed, blocked, progress_message_id
+        ''', (self.owner, now, now - self.lease_timeout)).fetchall()
+
+    async def _poll(self):
+        now = time.time()
+        if self._tasks:
+            # Продлеваем только рассылки, которые действительно выполняются в этом процессе
+            ids = list(self._tasks)
+            await db.execute(
+                f"UPDATE broadcasts SET heartbeat_at = ? WHERE owner = ? AND id IN ({', '.join('?' * len(ids))})",
+                (now, self.owner, *ids)
+            )
+        for row in await db.transaction(self._claim, now):
+            job = BroadcastJob(*row)
+            if job.id not in self._tasks:
+                logger.info("Рассылка #%d: выполняем с пользователя id > %d", job.id, job.last_user_id)
+                self._spawn(job)
+
+    async def _run_queue(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._poll()
+            except Exception as e:
+                logger.error("Ошибка опроса очереди рассылок: %s", e)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    def start_runner(self):
+        """Выполнять рассылки в этом процессе (включая прерванные рестартом)."""
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run_queue(), name="broadcast-runner")
+
+    def _spawn(self, job: BroadcastJob):
+        task = asyncio.create_task(self._run(job), name=f"broadcast-{job.id}")
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def _send(self, telegram_id: int, text: str) -> str:
+        for _ in range(self.MAX_ATTEMPTS):
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(telegram_id, text)
+                return DELIVERED
+            except TelegramRetryAfter as e:
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return BLOCKED
+            except TelegramBadRequest as e:
+                logger.debug("Рассылка: пользователь %s недоступен: %s", telegram_id, e)
+                return FAILED
+            except Exception as e:
+                logger.warning("Рассылка: ошибка отправки пользователю %s: %s", telegram_id, e)
+        return FAILED
+
+    async def _send_chunk(self, job: BroadcastJob, recipients):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def send_one(telegram_id):
+            async with semaphore:
+                return await self._send(telegram_id, job.text)
+
+        results = await asyncio.gather(*(send_one(telegram_id) for _, telegram_id in recipients))
+        job.delivered += results.count(DELIVERED)
+        job.failed += results.count(FAILED)
+        job.blocked += results.count(BLOCKED)
+        job.last_user_id = recipients[-1][0]
+
+    async def _checkpoint(self, job: BroadcastJob, finished: bool = False) -> bool:
+        """Сохраняет прогресс. False — аренду забрал другой процесс, рассылку надо бросить."""
+        return await db.execute('''
+            UPDATE broadcasts
+            SET last_user_id = ?, delivered = ?, failed = ?, blocked = ?, status = ?,
+                finished_at = CASE WHEN ? THEN CURRENT_TIMESTAMP END, heartbeat_at = ?
+            WHERE id = ? AND owner = ?
+        ''', (job.last_user_id, job.delivered, job.failed, job.blocked,
+              "done" if finished else "running", finished, time.time(), job.id, self.owner)) > 0
+
+    async def _report(self, job: BroadcastJob, finished: bool = False):
+        try:
+            if job.progress_message_id:
+                await self.bot.edit_message_text(
+                    job.progress_text(finished), chat_id=job.admin_id, message_id=job.progress_message_id
+                )
+            else:
+                await self.bot.send_message(job.admin_id, job.progress_text(finished))
+        except TelegramBadRequest:
+            # Сообщение не изменилось или удалено — не критично
+            pass
+        except Exception as e:
+            logger.warning("Рассылка #%d: не удалось обновить прогресс: %s", job.id, e)
+
+    async def _run(self, job: BroadcastJob):
+        last_report = time.monotonic()
+        try:
+            while True:
+                recipients = await db.fetchall(
+                    "SELECT id, telegram_id FROM users WHERE id > ? ORDER BY id LIMIT ?",
+                    (job.last_user_id, self.chunk_size)
+                )
+                if not recipients:
+                    break
+                await self._send_chunk(job, recipients)
+                if not await self._checkpoint(job):
+                    logger.warning("Рассылка #%d: аренду забрал другой процесс, останавливаемся", job.id)
+                    return
+                if time.monotonic() - last_report >= self.PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await self._report(job)
+        except asyncio.CancelledError:
+            # Остановка процесса: прогресс уже сохранен, продолжим после рестарта
+            raise
+        except Exception:
+            logger.exception("Рассылка #%d прервана ошибкой", job.id)
+            # Отпускаем аренду: runner заберет рассылку снова и продолжит с последней пачки
+            try:
+                await db.execute(
+                    "UPDATE broadcasts SET owner = NULL WHERE id = ? AND owner = ?", (job.id, self.owner)
+                )
+            except Exception as e:
+                logger.error("Рассылка #%d: не удалось отпустить аренду: %s", job.id, e)
+            return
+
+        if not await self._checkpoint(job, finished=True):
+            logger.warning("Рассылка #%d: аренду забрал другой процесс, итог не сохранен", job.id)
+            return
+        await self._report(job, finished=True)
+        logger.info(
+            "Рассылка #%d завершена: доставлено %d, заблокировали %d, ошибок %d",
+            job.id, job.delivered, job.blocked, job.failed
+        )
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        if self._runner is not None:
+            tasks.append(self._runner)
+            self._runner = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Прогресс сохранен — отпускаем аренду, чтобы новый процесс продолжил сразу
+        await db.execute(
+            "UPDATE broadcasts SET owner = NULL WHERE owner = ? AND status = 'running'", (self.owner,)
+        )
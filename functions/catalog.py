@@ -0,0 +1,429 @@
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass, fields
+from typing import Optional
+
+from database.db import db
+
+
+logger = logging.getLogger(__name__)
+
+# Курсорная (keyset) пагинация: страница задается id товара, после (или до)
+# которого ее нужно начинать, поэтому стоимость любой страницы одинакова
+# и строки не "съезжают" между страницами, когда товары раскупают.
+DIRECTION_NEXT = "n"
+DIRECTION_PREV = "p"
+# Кнопка страницы: page_<направление>_<id>_<фильтр> не длиннее 64 байт
+MAX_ENCODED_FILTER = 40
+
+
+@dataclass(frozen=True)
+class CatalogFilter:
+    """Фильтр каталога. cores/ram/ssd — минимальные значения, цена — диапазон."""
+    geo: Optional[str] = None
+    cores: Optional[int] = None
+    ram: Optional[int] = None
+    ssd: Optional[int] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+
+    def is_empty(self) -> bool:
+        return all(getattr(self, f.name) is None for f in fields(self))
+
+    def where(self):
+        """Возвращает (список условий SQL, параметры).
+
+        Диапазонные условия записаны как `+column`, чтобы планировщик не выбирал
+        по ним индекс с последующей сортировкой: страница всегда идет по id
+        (или по idx_products_geo_catalog), и ее цена не зависит от глубины.
+        """
+        clauses, params = [], []
+        if self.geo is not None:
+            clauses.append("geo = ?")
+            params.append(self.geo)
+        for column in ("cores", "ram", "ssd"):
+            value = getattr(self, column)
+            if value is not None:
+                clauses.append(f"+{column} >= ?")
+                params.append(value)
+        if self.price_min is not None:
+            clauses.append("+price >= ?")
+            params.append(self.price_min)
+        if self.price_max is not None:
+            clauses.append("+price <= ?")
+            params.append(self.price_max)
+        return clauses, params
+
+    def matches(self, product) -> bool:
+        """Проверка компактной записи товара (id, cores, ram, ssd, geo, price)."""
+        _, cores, ram, ssd, geo, price = product
+        return not (
+            (self.geo is not None and geo != self.geo)
+            or (self.cores is not None and cores < self.cores)
+            or (self.ram is not None and ram < self.ram)
+            or (self.ssd is not None and ssd < self.ssd)
+            or (self.price_min is not None and price < self.price_min)
+            or (self.price_max is not None and price > self.price_max)
+        )
+
+    def encode(self) -> str:
+        """Компактная запись для callback_data (лимит Telegram — 64 байта)."""
+        parts = []
+        if self.geo is not None:
+            parts.append(f"g{self.geo}")
+        if self.cores is not None:
+            parts.append(f"c{self.cores}")
+        if self.ram is not None:
+            parts.append(f"r{self.ram}")
+        if self.ssd is not None:
+            parts.append(f"s{self.ssd}")
+        if self.price_min is not None or self.price_max is not None:
+            low = _format_price(self.price_min)
+            high = _format_price(self.price_max)
+            # ":" не встречается в записи числа (в отличие от "-" в 1e-05)
+            parts.append(f"p{low}:{high}")
+        return ",".join(parts)
+
+    @classmethod
+    def decode(cls, value: str) -> "CatalogFilter":
+        kwargs = {}
+        for part in filter(None, value.split(",")):
+            key, raw = part[0], part[1:]
+            if key == "g":
+                kwargs["geo"] = raw
+            elif key == "c":
+                kwargs["cores"] = int(raw)
+            elif key == "r":
+                kwargs["ram"] = int(raw)
+            elif key == "s":
+                kwargs["ssd"] = int(raw)
+            elif key == "p":
+                # Кнопки старого формата p<min>-<max> из уже отправленных сообщений
+                low, _, high = raw.partition(":" if ":" in raw else "-")
+                kwargs["price_min"] = float(low) if low else None
+                kwargs["price_max"] = float(high) if high else None
+        return cls(**kwargs)
+
+    @classmethod
+    def parse(cls, text: str) -> "CatalogFilter":
+        """Разбирает пользовательский ввод вида `geo=NL cores=4 ram=8 ssd=100 price=5-20`."""
+        kwargs = {}
+        for key, value in re.findall(r"(\w+)\s*=\s*([\w.\-]+)", text):
+            key = key.lower()
+            if key == "geo":
+                kwargs["geo"] = value.upper()
+            elif key in ("cores", "ram", "ssd"):
+                kwargs[key] = int(value)
+            elif key == "price":
+                low, _, high = value.partition("-")
+                kwargs["price_min"] = float(low) if low else None
+                kwargs["price_max"] = float(high) if high else None
+            else:
+                raise ValueError(f"Неизвестный фильтр: {key}")
+        flt = cls(**kwargs)
+        if len(flt.encode()) > MAX_ENCODED_FILTER:
+            raise ValueError("Фильтр не помещается в callback_data")
+        return flt
+
+
+def _format_price(value: Optional[float]) -> str:
+    # repr — кратчайшая запись, из которой float восстанавливается без потерь
+    if value is None:
+        return ""
+    text = repr(float(value))
+    return text[:-2] if text.endswith(".0") else text
+
+
+@dataclass
+class CatalogPage:
+    products: list  # [(id, cores, ram, ssd, geo, price), ...] или строки с запрошенными колонками
+    has_prev: bool
+    has_next: bool
+
+
+def _exists(conn, clauses, params) -> bool:
+    sql = "SELECT 1 FROM products WHERE " + " AND ".join(clauses) + " LIMIT 1"
+    return conn.execute(sql, params).fetchone() is not None
+
+
+CATALOG_COLUMNS = "id, cores, ram, ssd, geo, price"
+
+
+def _fetch_page(conn, cursor, direction, flt, limit, columns=CATALOG_COLUMNS):
+    clauses, params = flt.where()
+    page_clauses = list(clauses)
+    page_params = list(params)
+
+    if direction == DIRECTION_PREV and cursor is not None:
+        page_clauses.append("id < ?")
+        page_params.append(cursor)
+        order = "DESC"
+    else:
+        if cursor is not None:
+            page_clauses.append("id > ?")
+            page_params.append(cursor)
+        order = "ASC"
+
+    sql = f"SELECT {columns} FROM products"
+    if page_clauses:
+        sql += " WHERE " + " AND ".join(page_clauses)
+    sql += f" ORDER BY id {order} LIMIT ?"
+    rows = conn.execute(sql, page_params + [limit + 1]).fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if order == "DESC":
+        rows.reverse()
+
+    if not rows:
+        return CatalogPage([], False, False)
+
+    first_id, last_id = rows[0][0], rows[-1][0]
+    if order == "DESC":
+        has_prev = has_more
+        has_next = _exists(conn, clauses + ["id > ?"], params + [last_id])
+    else:
+        has_next = has_more
+        has_prev = _exists(conn, clauses + ["id < ?"], params + [first_id])
+    return CatalogPage(rows, has_prev, has_next)
+
+
+def _sequence(conn, table):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def _load_catalog(conn):
+    # Товары и позиции журналов читаются из одного снимка БД
+    conn.execute("BEGIN")
+    try:
+        change_seq = _sequence(conn, "catalog_changes")
+        max_id = _sequence(conn, "products")
+        rows = conn.execute(f"SELECT {CATALOG_COLUMNS} FROM products ORDER BY id").fetchall()
+    finally:
+        conn.execute("COMMIT")
+    return rows, change_seq, max_id
+
+
+def _load_catalog_changes(conn, change_seq, max_id, limit):
+    """Изменения каталога, сделанные после снимка (change_seq, max_id).
+
+    Возвращает None, если изменений больше limit или часть журнала уже
+    удалена, — тогда каталог проще перечитать целиком.
+    """
+    conn.execute("BEGIN")
+    try:
+        changes = conn.execute(
+            "SELECT seq, product_id FROM catalog_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+            (change_seq, limit + 1)
+        ).fetchall()
+        if len(changes) > limit or (changes and changes[0][0] != change_seq + 1):
+            return None
+        changed_ids = sorted({product_id for _, product_id in changes})
+        changed_rows = []
+        if changed_ids:
+            placeholders = ", ".join("?" * len(changed_ids))
+            changed_rows = conn.execute(
+                f"SELECT {CATALOG_COLUMNS} FROM products WHERE id IN ({placeholders})", changed_ids
+            ).fetchall()
+        new_rows = conn.execute(
+            f"SELECT {CATALOG_COLUMNS} FROM products WHERE id > ? ORDER BY id", (max_id,)
+        ).fetchall()
+        new_max_id = max(max_id, _sequence(conn, "products"))
+    finally:
+        conn.execute("COMMIT")
+    new_seq = changes[-1][0] if changes else change_seq
+    return new_seq, new_max_id, changed_ids, changed_rows, new_rows
+
+
+class CatalogCache:
+    """Кэш каталога в памяти процесса.
+
+    Хранит компактные записи товаров без логинов и паролей и уже собранные
+    клавиатуры страниц. Любая запись в каталог (добавление, удаление, покупка)
+    должна сообщить об этом кэшу через invalidate()/discard(), после чего
+    версия увеличивается и собранные страницы сбрасываются.
+
+    Изменения из других процессов (воркеры вебхука, supervisor) кэш подтягивает
+    сам: sync() читает журнал catalog_changes и новые id товаров.
+    """
+
+    MAX_RENDERED_PAGES = 2048
+    MAX_SYNC_CHANGES = 5000
+    PRUNE_INTERVAL = 60
+
+    def __init__(self):
+        self.version = 0
+        self._products: dict[int, tuple] = {}
+        self._ids: list[int] = []
+        self._rendered: dict = {}
+        self._loaded = False
+        self._dirty = False
+        self._discarded_during_load = None
+        self._change_seq = 0
+        self._max_id = 0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _bump(self):
+        self.version += 1
+        self._rendered.clear()
+
+    def invalidate(self):
+        """Каталог изменился непредсказуемо (например, добавлены товары) — перечитать при следующем запросе."""
+        self._bump()
+        self._loaded = False
+        self._dirty = True
+
+    def discard(self, *product_ids: int):
+        """Товары ушли из наличия (куплены или удалены)."""
+        self._bump()
+        if self._discarded_during_load is not None:
+            self._discarded_during_load.update(product_ids)
+        for product_id in product_ids:
+            if self._products.pop(product_id, None) is not None:
+                del self._ids[bisect_left(self._ids, product_id)]
+
+    async def _ensure_loaded(self):
+        if self._loaded:
+            return
+        # Одна перезагрузка на всех: остальные читатели ждут ее на блокировке
+        async with self._lock:
+            while not self._loaded:
+                self._dirty = False
+                self._discarded_during_load = set()
+                try:
+                    rows, change_seq, max_id = await db.run(_load_catalog)
+                finally:
+                    discarded, self._discarded_during_load = self._discarded_during_load, None
+                if self._dirty:
+                    continue
+                self._products = {row[0]: tuple(row) for row in rows if row[0] not in discarded}
+                self._ids = list(self._products)
+                self._change_seq, self._max_id = change_seq, max_id
+                self._loaded = True
+                logger.debug("Каталог загружен в кэш: %s товаров, версия %s", len(self._ids), self.version)
+
+    async def sync(self):
+        """Применяет изменения каталога, сделанные другими процессами."""
+        if not self._loaded:
+            return
+        async with self._lock:
+            if not self._loaded:
+                return
+            self._dirty = False
+            self._discarded_during_load = set()
+            try:
+                result = await db.run(_load_catalog_changes, self._change_seq, self._max_id, self.MAX_SYNC_CHANGES)
+            finally:
+                discarded, self._discarded_during_load = self._discarded_during_load, None
+            if self._dirty:
+                return
+            if result is None:
+                self.invalidate()
+                return
+
+            self._change_seq, self._max_id, changed_ids, changed_rows, new_rows = result
+            if not changed_ids and not new_rows:
+                return
+            self._bump()
+            for product_id in changed_ids:
+                if self._products.pop(product_id, None) is not None:
+                    del self._ids[bisect_left(self._ids, product_id)]
+            for row in changed_rows + new_rows:
+                if row[0] in discarded or row[0] in self._products:
+                    continue
+                self._products[row[0]] = tuple(row)
+                insort(self._ids, row[0])
+
+    async def _run(self, interval: float, retention: Optional[float]):
+        # Каталог загружается в фоне сразу после старта: бот уже отвечает,
+        # а первый запрос каталога ждет только остаток загрузки
+        try:
+            await self._ensure_loaded()
+        except Exception as e:
+            logger.error("Ошибка загрузки кэша каталога: %s", e)
+        pruned_at = time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+                if retention is not None and time.monotonic() - pruned_at >= self.PRUNE_INTERVAL:
+                    await db.execute(
+                        "DELETE FROM catalog_changes WHERE changed_at < strftime('%s', 'now') - ?", (int(retention),)
+                    )
+                    pruned_at = time.monotonic()
+            except Exception as e:
+                logger.error("Ошибка синхронизации кэша каталога: %s", e)
+
+    def start(self, interval: float, retention: Optional[float] = None):
+        """Периодическая синхронизация; retention — чистить журнал старше N секунд (в одном процессе)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(interval, retention))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def get(self, product_id: int) -> Optional[tuple]:
+        await self._ensure_loaded()
+        return self._products.get(product_id)
+
+    def _scan(self, start, step, flt, count):
+        found = []
+        ids, products = self._ids, self._products
+        i = start
+        while 0 <= i < len(ids) and len(found) < count:
+            product = products[ids[i]]
+            if flt.matches(product):
+                found.append(product)
+            i += step
+        return found
+
+    def _page(self, cursor, direction, flt, limit) -> CatalogPage:
+        ids = self._ids
+        if direction == DIRECTION_PREV and cursor is not None:
+            rows = self._scan(bisect_left(ids, cursor) - 1, -1, flt, limit + 1)
+            has_prev = len(rows) > limit
+            rows = rows[:limit][::-1]
+            has_next = bool(rows) and bool(self._scan(bisect_right(ids, rows[-1][0]), 1, flt, 1))
+        else:
+            start = bisect_right(ids, cursor) if cursor is not None else 0
+            rows = self._scan(start, 1, flt, limit + 1)
+            has_next = len(rows) > limit
+            rows = rows[:limit]
+            has_prev = bool(rows) and bool(self._scan(bisect_left(ids, rows[0][0]) - 1, -1, flt, 1))
+        return CatalogPage(rows, has_prev, has_next)
+
+    async def page(self, cursor: Optional[int] = None, direction: str = DIRECTION_NEXT,
+                   flt: Optional[CatalogFilter] = None, limit: int = 7) -> CatalogPage:
+        """Страница каталога, начинающаяся после (или заканчивающаяся перед) товаром cursor."""
+        await self._ensure_loaded()
+        flt = flt or CatalogFilter()
+        page = self._page(cursor, direction, flt, limit)
+        if not page.products and cursor is not None:
+            # Все товары вокруг курсора раскупили — показываем первую страницу
+            page = self._page(None, DIRECTION_NEXT, flt, limit)
+        return page
+
+    def get_rendered(self, key):
+        return self._rendered.get(key)
+
+    def store_rendered(self, key, version: int, markup):
+        """Сохраняет собранную клавиатуру, если каталог не менялся, пока ее собирали."""
+        if version != self.version:
+            return
+        if len(self._rendered) >= self.MAX_RENDERED_PAGES:
+            self._rendered.clear()
+        self._rendered[key] = markup
+
+
+catalog_cache = CatalogCache()
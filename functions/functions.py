@@ -1,156 +1,69 @@
+import csv
+import os
 import sqlite3
 import logging
-import uuid
-import requests
-from requests.auth import HTTPBasicAuth
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
 from config import config
 from payments.currency import get_usd_exchange_rate
-
-YOOKASSA_URL = "https://api.yookassa.ru/v3/payments"
+from payments.http import ProviderError
+from payments.yookassa import yookassa
+from database.db import db
+from functions.ledger import SOURCE_ADMIN, SOURCE_TOPUP_CRYPTO, SOURCE_TOPUP_YOO, from_cents, post_entry, to_cents
+from functions.catalog import CatalogPage, DIRECTION_NEXT, DIRECTION_PREV
 
 logger = logging.getLogger(__name__)
 
 
-def create_db():
-    conn = sqlite3.connect("vds_shop.db")
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id INTEGER UNIQUE,
-            balance REAL DEFAULT 0,
-            promo_code TEXT DEFAULT NULL
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS products (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            ip TEXT,
-            login TEXT,
-            password TEXT,
-            cores INTEGER,
-            ram INTEGER,
-            ssd INTEGER,
-            geo TEXT,  -- добавлено поле geo
-            price REAL
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS purchases (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id INTEGER,
-            ip TEXT,
-            login TEXT,
-            password TEXT,
-            cores INTEGER,
-            ram INTEGER,
-            ssd INTEGER,
-            geo TEXT,
-            price REAL,
-            purchase_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS promo_codes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            code TEXT UNIQUE,
-            discount REAL,
-            usage_limit INTEGER
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            telegram_id INTEGER,
-            payment_id TEXT UNIQUE,
-            amount_rub REAL,
-            amount_usd REAL,
-            status TEXT DEFAULT 'pending',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS crypto_payments (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            invoice_id TEXT UNIQUE,
-            telegram_id INTEGER,
-            amount REAL,
-            status TEXT DEFAULT 'pending'
-        )
-    ''')
-    cursor.execute("PRAGMA table_info(products)")
-    columns = [col[1] for col in cursor.fetchall()]
-    
-    if "geo" not in columns:
-        cursor.execute("ALTER TABLE products ADD COLUMN geo TEXT DEFAULT 'N/A'")  # Добавляем geo, если его нет
-    conn.commit()
-
-
-
-
-
-
-def create_user(telegram_id):
-    conn = sqlite3.connect('vds_shop.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id FROM users WHERE telegram_id = ?
+async def create_user(telegram_id):
+    await db.execute('''
+        INSERT OR IGNORE INTO users (telegram_id) VALUES (?)
     ''', (telegram_id,))
-    user = cursor.fetchone()
-
-    if not user:
-        cursor.execute('''
-            INSERT INTO users (telegram_id, balance) VALUES (?, 0)
-        ''', (telegram_id,))
-        conn.commit()
 
 
+@dataclass
+class UserStats:
+    balance: float = 0
+    purchase_count: int = 0
+    total_spent: float = 0
+    total_topped_up: float = 0
+    last_purchase_at: Optional[str] = None
 
 
-def get_user(telegram_id):
-    conn = sqlite3.connect('vds_shop.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT telegram_id, balance FROM users WHERE telegram_id = ?
+async def get_user_stats(telegram_id) -> UserStats:
+    """Баланс и агрегаты профиля одним чтением по уникальному индексу telegram_id."""
+    row = await db.fetchone('''
+        SELECT balance_cents, purchase_count, total_spent_cents, total_topped_up_cents, last_purchase_at
+        FROM users WHERE telegram_id = ?
     ''', (telegram_id,))
-    user = cursor.fetchone()
+    if not row:
+        return UserStats()
+    balance_cents, purchase_count, spent_cents, topped_up_cents, last_purchase_at = row
+    return UserStats(
+        from_cents(balance_cents), purchase_count, from_cents(spent_cents), from_cents(topped_up_cents), last_purchase_at
+    )
 
 
-    if user:
-        return {"telegram_id": user[0], "balance": user[1]}
-    return None
-
+async def get_user_balance(telegram_id):
+    result = await db.fetchone("SELECT balance_cents FROM users WHERE telegram_id = ?", (telegram_id,))
+    return from_cents(result[0]) if result else 0
 
-def get_user_balance(telegram_id):
-    conn = sqlite3.connect("vds_shop.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT balance FROM users WHERE telegram_id = ?", (telegram_id,))
-    result = cursor.fetchone()
-    print(f"Текущий баланс пользователя {telegram_id}: {result[0]}")
-    return result[0] if result else 0
 
-def update_user_balance(telegram_id, amount):
-    conn = sqlite3.connect("vds_shop.db")
-    cursor = conn.cursor()
-    
+async def update_user_balance(telegram_id, amount) -> Optional[float]:
+    """Ручное изменение баланса админом. Возвращает новый баланс или None
+    (пользователь не найден или баланс ушел бы в минус)."""
     try:
-        with conn:
-            cursor.execute("UPDATE users SET balance = balance + ? WHERE telegram_id = ?", (amount, telegram_id))
-        conn.commit()
-        print(f"Баланс пользователя {telegram_id} обновлен на {amount}.")
+        balance_cents = await db.transaction(
+            post_entry, telegram_id, to_cents(amount), SOURCE_ADMIN, None, True
+        )
     except sqlite3.OperationalError as e:
-        print(f"Ошибка при обновлении баланса: {e}")
-    finally:
-        conn.close()
-
-
-
+        logger.error("Ошибка при обновлении баланса: %s", e)
+        return None
+    if balance_cents is None:
+        return None
+    logger.debug("Баланс пользователя %s обновлен на %s.", telegram_id, amount)
+    return from_cents(balance_cents)
 
 
 COUNTRY_FLAGS = {
@@ -175,217 +88,238 @@ def get_flag(geo):
     return COUNTRY_FLAGS.get(geo, "🏳️")
 
 
-def get_user_purchase_count(user_id: int) -> int:
-    conn = sqlite3.connect("vds_shop.db")
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT COUNT(*) FROM purchases WHERE telegram_id = ?", (user_id,))
-    count = cursor.fetchone()[0]
+PURCHASE_COLUMNS = "id, ip, login, password, cores, ram, ssd, geo, price, purchase_time"
+PURCHASE_HEADER = ["id", "ip", "login", "password", "cores", "ram", "ssd", "geo", "price", "purchase_time"]
+
+
+def _purchase_exists(conn, user_id, op, cursor):
+    row = conn.execute(
+        f"SELECT 1 FROM purchases WHERE telegram_id = ? "
+        f"AND (purchase_time, id) {op} (SELECT purchase_time, id FROM purchases WHERE id = ?) LIMIT 1",
+        (user_id, cursor)
+    ).fetchone()
+    return row is not None
+
+
+def _fetch_purchases_page(conn, user_id, cursor, direction, limit):
+    # Новые покупки сверху; курсор — id покупки, страница идет по индексу
+    # idx_purchases_user_time без OFFSET
+    if cursor is None:
+        condition, params, order = "", [user_id], "DESC"
+    elif direction == DIRECTION_PREV:
+        condition, params, order = "AND (purchase_time, id) > (SELECT purchase_time, id FROM purchases WHERE id = ?)", [user_id, cursor], "ASC"
+    else:
+        condition, params, order = "AND (purchase_time, id) < (SELECT purchase_time, id FROM purchases WHERE id = ?)", [user_id, cursor], "DESC"
+
+    rows = conn.execute(
+        f"SELECT {PURCHASE_COLUMNS} FROM purchases WHERE telegram_id = ? {condition} "
+        f"ORDER BY purchase_time {order}, id {order} LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if order == "ASC":
+        rows.reverse()
+    if not rows:
+        return CatalogPage([], False, False)
+
+    if order == "ASC":
+        return CatalogPage(rows, has_more, _purchase_exists(conn, user_id, "<", rows[-1][0]))
+    return CatalogPage(rows, _purchase_exists(conn, user_id, ">", rows[0][0]), has_more)
+
+
+async def get_user_purchases_page(user_id: int, cursor: int = None, direction: str = DIRECTION_NEXT,
+                                  limit: int = 5) -> CatalogPage:
+    """Страница истории покупок. has_prev — есть более новые, has_next — более старые."""
+    page = await db.run(_fetch_purchases_page, user_id, cursor, direction, limit)
+    if not page.products and cursor is not None:
+        page = await db.run(_fetch_purchases_page, user_id, None, DIRECTION_NEXT, limit)
+    return page
+
+
+def _export_user_purchases(conn, user_id, path):
+    count = 0
+    cursor = conn.execute(
+        f"SELECT {PURCHASE_COLUMNS} FROM purchases WHERE telegram_id = ? ORDER BY purchase_time DESC, id DESC",
+        (user_id,)
+    )
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(PURCHASE_HEADER)
+        while True:
+            rows = cursor.fetchmany(1000)
+            if not rows:
+                break
+            writer.writerows(rows)
+            count += len(rows)
+    return count
 
 
-    return count
+async def export_user_purchases(user_id: int):
+    """Выгружает все покупки пользователя в CSV. Возвращает (путь, число строк); файл удаляет вызывающий."""
+    fd, path = tempfile.mkstemp(prefix="purchases_", suffix=".csv")
+    os.close(fd)
+    try:
+        count = await db.run(_export_user_purchases, user_id, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
 
 
-def apply_discount(user_id, price):
-    conn = sqlite3.connect("vds_shop.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT promo_code FROM users WHERE telegram_id = ?", (user_id,))
-    promo_code = cursor.fetchone()
-    
-    if promo_code and promo_code[0]:
-        cursor.execute("SELECT discount FROM promo_codes WHERE code = ?", (promo_code[0],))
-        discount = cursor.fetchone()
-        if discount:
-            price *= (1 - discount[0] / 100)
-    
-    return round(price, 2)
-
-def apply_promo_code(user_id, price):
-    conn = sqlite3.connect('vds_shop.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT promo_code FROM users WHERE telegram_id = ?", (user_id,))
-    promo_code = cursor.fetchone()
-    
-    if promo_code and promo_code[0]:
-        cursor.execute("SELECT discount, usage_limit FROM promo_codes WHERE code = ?", (promo_code[0],))
-        promo = cursor.fetchone()
-        if promo:
-            discount, usage_limit = promo
-            new_price = price - (price * discount / 100)
-            
-            # Уменьшаем количество оставшихся использований
-            cursor.execute("UPDATE promo_codes SET usage_limit = usage_limit - 1 WHERE code = ?", (promo_code[0],))
-            
-            # Если лимит исчерпан, удаляем промокод
-            if usage_limit - 1 <= 0:
-                cursor.execute("DELETE FROM promo_codes WHERE code = ?", (promo_code[0],))
-            
-            # Удаляем промокод у пользователя после использования
-            cursor.execute("UPDATE users SET promo_code = NULL WHERE telegram_id = ?", (user_id,))
-            
-            conn.commit()
-            print(f"Применен промокод: {promo_code[0]}, новая цена: {new_price}")
-            return new_price
-    print(f"Промокод не найден или не применим. Цена остается без изменений: {price}")
-    return price
-
-
-
-
-
-
-def create_payment(amount_rub, user_id):
+async def create_payment(amount_rub, user_id):
     """Создает платеж в YooKassa и сохраняет его в БД"""
-    idempotence_key = str(uuid.uuid4())
-    headers = {
-        "Content-Type": "application/json",
-        "Idempotence-Key": idempotence_key
-    }
-    
     usd_rate = get_usd_exchange_rate()
     amount_usd = round(amount_rub / usd_rate, 2)
 
-    data = {
-        "amount": {"value": f"{amount_rub:.2f}", "currency": "RUB"},
-        "confirmation": {"type": "redirect", "return_url": config.RETURN_URL},
-        "capture": True,
-        "description": f"Пополнение баланса на {amount_usd} USD для @{user_id}",
-        "metadata": {
-            "telegram_id": str(user_id),
-            "amount_usd": f"{amount_usd:.2f}"
-        }
-    }
-
-    logger.debug(f"Создание платежа: amount_rub={amount_rub}, user_id={user_id}, idempotence_key={idempotence_key}")
+    logger.debug("Создание платежа: amount_rub=%s, user_id=%s", amount_rub, user_id)
 
     try:
-        response = requests.post(
-            YOOKASSA_URL,
-            json=data,
-            headers=headers,
-            auth=HTTPBasicAuth(config.YOOKASSA_SHOP_ID, config.YOOKASSA_SECRET_KEY)
+        payment = await yookassa.create_payment(
+            amount_rub,
+            description=f"Пополнение баланса на {amount_usd} USD для @{user_id}",
+            metadata={
+                "telegram_id": str(user_id),
+                "amount_usd": f"{amount_usd:.2f}"
+            },
+            return_url=config.RETURN_URL,
         )
         
-        logger.debug(f"Статус ответа YooKassa: {response.status_code}")
-        logger.debug(f"Ответ YooKassa: {response.text}")
-
-        if response.status_code not in (200, 201):
-            error_msg = response.json().get('description', 'Неизвестная ошибка')
-            logger.error(f"Ошибка YooKassa: {error_msg}")
-            raise Exception(f"Ошибка создания платежа: {error_msg}")
-
-        payment_data = response.json()
-        payment_id = payment_data['id']
-        
-        conn = sqlite3.connect('vds_shop.db')
-        cursor = conn.cursor()
         try:
-            cursor.execute('''
+            await db.execute('''
                 INSERT INTO payments (telegram_id, payment_id, amount_rub, amount_usd, status)
                 VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, payment_id, amount_rub, amount_usd, 'pending'))
-            conn.commit()
-            logger.debug(f"Платеж {payment_id} успешно сохранен в БД")
+            ''', (user_id, payment.id, amount_rub, amount_usd, 'pending'))
+            logger.debug("Платеж %s успешно сохранен в БД", payment.id)
         except sqlite3.IntegrityError as e:
-            logger.error(f"Ошибка при сохранении в БД (вероятно, дубликат payment_id): {e}")
+            logger.error("Ошибка при сохранении в БД (вероятно, дубликат payment_id): %s", e)
             raise
         except sqlite3.Error as e:
-            logger.error(f"Ошибка базы данных: {e}")
+            logger.error("Ошибка базы данных: %s", e)
             raise
-        finally:
-            conn.close()
 
-        return payment_data, amount_usd
+        return payment, amount_usd
 
     except Exception as e:
-        logger.error(f"Общая ошибка в create_payment: {e}")
+        logger.error("Общая ошибка в create_payment: %s", e)
         raise
 
 
-def check_and_update_payment(payment_id):
-    url = f"https://api.yookassa.ru/v3/payments/{payment_id}"
-    try:
-        response = requests.get(
-            url,
-            auth=(config.YOOKASSA_SHOP_ID, config.YOOKASSA_SECRET_KEY)
-        )
-        logger.debug(f"Проверка платежа {payment_id}: статус {response.status_code}, ответ: {response.text}")
-        
-        if response.status_code == 404:
-            logger.error(f"Платеж {payment_id} не найден на сервере YooKassa")
-            return False
-            
-        payment_data = response.json()
-    except requests.RequestException as e:
-        logger.error(f"Ошибка запроса к YooKassa для платежа {payment_id}: {e}")
-        return False
-    
-    conn = sqlite3.connect('vds_shop.db')
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+def _sync_payment_status(conn, payment_id, new_status):
+    """Обновляет статус платежа и при успехе зачисляет баланс в одной транзакции.
+
+    Возвращает (telegram_id, amount_usd), если баланс был зачислен именно сейчас.
+    """
+    payment = conn.execute('''
         SELECT telegram_id, amount_usd, status 
         FROM payments 
         WHERE payment_id = ?
-    ''', (payment_id,))
-    payment = cursor.fetchone()
-    
+    ''', (payment_id,)).fetchone()
+
     if not payment:
-        logger.error(f"Платеж {payment_id} не найден в локальной БД")
-        conn.close()
-        return False
-    
+        logger.error("Платеж %s не найден в локальной БД", payment_id)
+        return None
+
     telegram_id, amount_usd, current_status = payment
-    
 
-    if payment_data.get("status") == "succeeded" and current_status != "succeeded":
+    if new_status == "succeeded" and current_status != "succeeded":
+        amount_cents = to_cents(amount_usd)
+        post_entry(conn, telegram_id, amount_cents, SOURCE_TOPUP_YOO, payment_id)
+        conn.execute(
+            "UPDATE users SET total_topped_up_cents = total_topped_up_cents + ? WHERE telegram_id = ?",
+            (amount_cents, telegram_id)
+        )
+        conn.execute("UPDATE payments SET status = ? WHERE payment_id = ?", ('succeeded', payment_id))
+        logger.debug("Платеж %s обновлен до succeeded, баланс пользователя %s пополнен на %s", payment_id, telegram_id, amount_usd)
+        return telegram_id, amount_usd
 
-        update_user_balance(telegram_id, amount_usd)
-        
-        cursor.execute('''
-            UPDATE payments 
-            SET status = ? 
-            WHERE payment_id = ?
-        ''', ('succeeded', payment_id))
-        conn.commit()
-        conn.close()
-        logger.debug(f"Платеж {payment_id} обновлен до succeeded, баланс пользователя {telegram_id} пополнен на {amount_usd}")
-        return True
-        
-    elif payment_data.get("status") != current_status:
-        cursor.execute('''
-            UPDATE payments 
-            SET status = ? 
-            WHERE payment_id = ?
-        ''', (payment_data.get("status"), payment_id))
-        conn.commit()
-        logger.debug(f"Статус платежа {payment_id} обновлен в БД до {payment_data.get('status')}")
-    
-    conn.close()
-    return False
-
-def add_product(ip, login, password, cores, ram, ssd, geo, price):
+    if new_status != current_status:
+        conn.execute("UPDATE payments SET status = ? WHERE payment_id = ?", (new_status, payment_id))
+        logger.debug("Статус платежа %s обновлен в БД до %s", payment_id, new_status)
+    return None
+
+
+async def apply_yoo_payment_status(payment_id, status):
+    """Сохраняет статус YooKassa. Возвращает (telegram_id, amount_usd), если баланс зачислен."""
+    return await db.transaction(_sync_payment_status, payment_id, status)
+
+
+async def check_and_update_payment(payment_id):
     try:
-        conn = sqlite3.connect("vds_shop.db")
-        cursor = conn.cursor()
+        payment = await yookassa.get_payment(payment_id)
+    except ProviderError as e:
+        logger.error("Ошибка запроса к YooKassa для платежа %s: %s", payment_id, e)
+        return False
 
-        cursor.execute('''
-            INSERT INTO products (ip, login, password, cores, ram, ssd, geo, price)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (ip, login, password, cores, ram, ssd, geo, price))
+    if payment is None:
+        logger.error("Платеж %s не найден на сервере YooKassa", payment_id)
+        return False
+
+    return await apply_yoo_payment_status(payment_id, payment.status) is not None
+
+
+async def get_payment(payment_id):
+    """Возвращает (status, telegram_id, amount_usd) платежа YooKassa или None."""
+    return await db.fetchone(
+        "SELECT status, telegram_id, amount_usd FROM payments WHERE payment_id = ?", (payment_id,)
+    )
+
+
+async def add_crypto_payment(invoice_id, telegram_id, amount):
+    await db.execute(
+        "INSERT INTO crypto_payments (invoice_id, telegram_id, amount, status) VALUES (?, ?, ?, ?)",
+        (invoice_id, telegram_id, amount, "pending")
+    )
+
+
+async def get_pending_payments(after_id: int = 0, limit: int = 100):
+    """Пачка ожидающих платежей YooKassa: [(id, payment_id), ...] по возрастанию id."""
+    return await db.fetchall(
+        "SELECT id, payment_id FROM payments WHERE status = 'pending' AND id > ? ORDER BY id LIMIT ?",
+        (after_id, limit)
+    )
+
+
+async def get_pending_crypto_payments(after_id: int = 0, limit: int = 100):
+    """Пачка ожидающих инвойсов CryptoBot: [(id, invoice_id), ...] по возрастанию id."""
+    return await db.fetchall(
+        "SELECT id, invoice_id FROM crypto_payments WHERE status = 'pending' AND id > ? ORDER BY id LIMIT ?",
+        (after_id, limit)
+    )
+
+
+async def get_crypto_payment_status(invoice_id):
+    row = await db.fetchone("SELECT status FROM crypto_payments WHERE invoice_id = ?", (invoice_id,))
+    return row[0] if row else None
 
-        conn.commit()
-    except Exception as e:
-        logger.error(f"Ошибка при добавлении товара: {e}")
-        raise e
 
+async def set_crypto_payment_status(invoice_id, status):
+    await db.execute(
+        "UPDATE crypto_payments SET status = ? WHERE invoice_id = ? AND status = 'pending'", (status, invoice_id)
+    )
 
 
-def get_products(offset: int, limit: int):
-    conn = sqlite3.connect('vds_shop.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, cores, ram, ssd, geo, price FROM products LIMIT ? OFFSET ?", (limit, offset))
-    products = cursor.fetchall()
+def _credit_crypto_payment(conn, invoice_id):
+    row = conn.execute(
+        "SELECT telegram_id, amount, status FROM crypto_payments WHERE invoice_id = ?", (invoice_id,)
+    ).fetchone()
+    if not row:
+        logger.error("Не найдены данные платежа для invoice_id: %s", invoice_id)
+        return None
+    telegram_id, amount, status = row
+    if status == "paid":
+        return None
+    conn.execute("UPDATE crypto_payments SET status = ? WHERE invoice_id = ?", ("paid", invoice_id))
+    amount_cents = to_cents(amount)
+    post_entry(conn, telegram_id, amount_cents, SOURCE_TOPUP_CRYPTO, str(invoice_id))
+    conn.execute(
+        "UPDATE users SET total_topped_up_cents = total_topped_up_cents + ? WHERE telegram_id = ?",
+        (amount_cents, telegram_id)
+    )
+    logger.debug("Баланс пользователя %s пополнен на %s", telegram_id, amount)
+    return telegram_id, amount
 
 
-    return products
+async def credit_crypto_payment(invoice_id):
+    """Отмечает инвойс оплаченным и зачисляет баланс. Возвращает (telegram_id, amount) или None."""
+    return await db.transaction(_credit_crypto_payment, invoice_id)
@@ -0,0 +1,83 @@
+import logging
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Optional
+
+from database.db import db
+
+
+logger = logging.getLogger(__name__)
+
+# Источники движений по балансу (balance_ledger.source)
+SOURCE_OPENING = "opening"  # остаток на момент перехода на журнал
+SOURCE_PURCHASE = "purchase"
+SOURCE_TOPUP_YOO = "topup_yoo"
+SOURCE_TOPUP_CRYPTO = "topup_crypto"
+SOURCE_ADMIN = "admin"
+SOURCE_PROMO = "promo"
+
+
+def to_cents(amount) -> int:
+    """Сумма в долларах -> целые центы (банковское округление не используем: 0.005 -> 1 цент)."""
+    return int((Decimal(str(amount)) * 100).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+
+
+def from_cents(cents: int) -> float:
+    return cents / 100
+
+
+def post_entry(conn, telegram_id: int, amount_cents: int, source: str,
+               reference: Optional[str] = None, require_funds: bool = False) -> Optional[int]:
+    """Проводит движение по балансу внутри транзакции вызывающего кода.
+
+    Обновляет снимок users.balance_cents и дописывает запись в журнал.
+    Возвращает новый баланс в центах или None, если пользователя нет
+    либо (при require_funds) баланс ушел бы в минус.
+    """
+    sql = "UPDATE users SET balance_cents = balance_cents + ? WHERE telegram_id = ?"
+    params = [amount_cents, telegram_id]
+    if require_funds:
+        sql += " AND balance_cents + ? >= 0"
+        params.append(amount_cents)
+    row = conn.execute(sql + " RETURNING balance_cents", params).fetchone()
+    if row is None:
+        return None
+
+    conn.execute('''
+        INSERT INTO balance_ledger (telegram_id, amount_cents, source, reference, balance_after_cents)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (telegram_id, amount_cents, source, reference, row[0]))
+    return row[0]
+
+
+@dataclass
+class BalanceMismatch:
+    telegram_id: int
+    balance_cents: int
+    ledger_cents: int
+
+
+def _reconcile(conn):
+    # Сумма по журналу считается по покрывающему индексу (telegram_id, amount_cents)
+    rows = conn.execute('''
+        SELECT u.telegram_id, u.balance_cents, COALESCE(l.total, 0)
+        FROM users u
+        LEFT JOIN (
+            SELECT telegram_id, SUM(amount_cents) AS total FROM balance_ledger GROUP BY telegram_id
+        ) l ON l.telegram_id = u.telegram_id
+        WHERE u.balance_cents != COALESCE(l.total, 0)
+    ''').fetchall()
+    orphans = conn.execute('''
+        SELECT telegram_id, 0, SUM(amount_cents) FROM balance_ledger
+        WHERE telegram_id NOT IN (SELECT telegram_id FROM users)
+        GROUP BY telegram_id
+    ''').fetchall()
+    return [BalanceMismatch(*row) for row in rows + orphans]
+
+
+async def reconcile_balances() -> list:
+    """Сверяет снимки балансов с журналом. Возвращает расхождения (пустой список — все сходится)."""
+    mismatches = await db.run(_reconcile)
+    if mismatches:
+        logger.error("Расхождения балансов с журналом: %s", len(mismatches))
+    return mismatches
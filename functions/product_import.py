@@ -0,0 +1,128 @@
+import csv
+import itertools
+import logging
+import os
+import re
+import tempfile
+from dataclasses import dataclass
+from typing import Optional
+
+from database.db import db
+from functions.catalog import catalog_cache
+
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_LINE_RE = re.compile(r"^(.*?):(.*?):(.*?):(\d+):(\d+):(\d+):([A-Za-z]+):([\d.]+)$")
+BATCH_SIZE = 1000
+INSERT_SQL = '''
+    INSERT INTO products (ip, login, password, cores, ram, ssd, geo, price, added_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+'''
+
+
+@dataclass
+class ImportResult:
+    added: int
+    rejected: int
+    report_path: Optional[str] = None  # файл с отклоненными строками
+
+    def cleanup(self):
+        if self.report_path and os.path.exists(self.report_path):
+            os.remove(self.report_path)
+
+
+def _to_row(fields):
+    """Приводит 8 полей товара к строке таблицы products или бросает ValueError."""
+    if len(fields) != 8:
+        raise ValueError(f"ожидается 8 полей, получено {len(fields)}")
+    ip, login, password, cores, ram, ssd, geo, price = (field.strip() for field in fields)
+    if not ip or not geo.isalpha():
+        raise ValueError("пустой ip или неверное гео")
+    return ip, login, password, int(cores), int(ram), int(ssd), geo.upper(), float(price)
+
+
+def _parse_text(lines):
+    """Строки формата ip:login:pass:cores:ram:ssd:geo:cost."""
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        match = PRODUCT_LINE_RE.match(line)
+        if not match:
+            yield line_no, line, None, "неверный формат"
+            continue
+        try:
+            yield line_no, line, _to_row(match.groups()), None
+        except ValueError as e:
+            yield line_no, line, None, str(e)
+
+
+def _parse_csv(lines):
+    """CSV с разделителем "," или ";" и колонками ip,login,password,cores,ram,ssd,geo,price."""
+    lines = iter(lines)
+    first = next(lines, "")
+    delimiter = ";" if first.count(";") > first.count(",") else ","
+    reader = csv.reader(itertools.chain([first], lines), delimiter=delimiter)
+    for fields in reader:
+        if not any(field.strip() for field in fields):
+            continue
+        line = delimiter.join(fields)
+        if reader.line_num == 1 and len(fields) > 3 and not fields[3].strip().isdigit():
+            continue  # строка заголовка
+        try:
+            yield reader.line_num, line, _to_row(fields), None
+        except ValueError as e:
+            yield reader.line_num, line, None, str(e)
+
+
+def _import(conn, lines, is_csv: bool, report):
+    parsed = _parse_csv(lines) if is_csv else _parse_text(lines)
+    added = rejected = 0
+    batch = []
+    for line_no, line, row, error in parsed:
+        if row is None:
+            rejected += 1
+            report.write(f"{line_no}: {error}: {line}\n")
+            continue
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(INSERT_SQL, batch)
+            added += len(batch)
+            batch.clear()
+    if batch:
+        conn.executemany(INSERT_SQL, batch)
+        added += len(batch)
+    return added, rejected
+
+
+def _import_to_report(conn, source, is_csv):
+    fd, report_path = tempfile.mkstemp(prefix="rejected_", suffix=".txt")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as report:
+            if isinstance(source, str):
+                with open(source, encoding="utf-8-sig", errors="replace", newline="") as lines:
+                    added, rejected = _import(conn, lines, is_csv, report)
+            else:
+                added, rejected = _import(conn, source, is_csv, report)
+    except BaseException:
+        # Транзакция откатится, отчет об отклоненных строках никому не нужен
+        os.remove(report_path)
+        raise
+    if not rejected:
+        os.remove(report_path)
+        report_path = None
+    return ImportResult(added, rejected, report_path)
+
+
+async def import_products(source, is_csv: bool = False) -> ImportResult:
+    """Импортирует товары одной транзакцией.
+
+    source — путь к файлу (читается потоком) или итерируемое строк.
+    Разбор и вставка пачками по BATCH_SIZE идут в потоке БД.
+    """
+    result = await db.transaction(_import_to_report, source, is_csv)
+    if result.added:
+        catalog_cache.invalidate()
+    logger.info("Импорт товаров: добавлено %d, отклонено %d", result.added, result.rejected)
+    return result
@@ -0,0 +1,161 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from config import config
+from database.db import db
+
+
+logger = logging.getLogger(__name__)
+
+# Ответы check()
+PROMO_ACTIVE = "active"
+PROMO_EXHAUSTED = "exhausted"
+PROMO_UNKNOWN = "unknown"
+PROMO_RATE_LIMITED = "rate_limited"
+
+
+@dataclass(frozen=True)
+class Promo:
+    code: str
+    discount: float
+    usage_limit: int
+
+
+@dataclass
+class PromoCheck:
+    status: str
+    promo: Optional[Promo] = None
+    retry_after: float = 0.0  # для PROMO_RATE_LIMITED: через сколько секунд можно пробовать снова
+
+
+def redeem_promo(conn, code: str) -> Optional[float]:
+    """Списывает одно использование промокода внутри транзакции вызывающего кода.
+
+    Проверка остатка и списание — один запрос, поэтому код нельзя использовать
+    больше usage_limit раз, сколько бы покупателей ни пришло одновременно.
+    Возвращает скидку в процентах или None, если код не существует или исчерпан.
+    """
+    row = conn.execute('''
+        UPDATE promo_codes SET usage_limit = usage_limit - 1
+        WHERE code = ? AND usage_limit > 0
+        RETURNING discount, usage_limit
+    ''', (code,)).fetchone()
+    if row is None:
+        return None
+    discount, remaining = row
+    if remaining <= 0:
+        conn.execute("DELETE FROM promo_codes WHERE code = ?", (code,))
+    return discount
+
+
+class PromoRegistry:
+    """Проверка промокодов, введенных пользователями, без лишних обращений к БД.
+
+    - найденные коды кэшируются на positive_ttl секунд (остаток в кэше
+      приблизительный: окончательно его проверяет redeem_promo при покупке);
+    - несуществующие коды запоминаются на negative_ttl секунд;
+    - каждый пользователь может ввести не больше guess_limit неверных кодов
+      за guess_window секунд, остальные попытки отклоняются без поиска кода.
+
+    Попытки хранятся в БД (promo_guesses), поэтому лимит общий для всех
+    воркеров. Кэш кодов локален для процесса: код, добавленный в другом
+    процессе, станет виден здесь не позже чем через negative_ttl секунд.
+    """
+
+    MAX_NEGATIVE = 10000
+
+    def __init__(self, positive_ttl: float, negative_ttl: float, guess_limit: int, guess_window: float):
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        self.guess_limit = guess_limit
+        self.guess_window = guess_window
+        self._active: dict[str, tuple[Promo, float]] = {}
+        self._unknown: dict[str, float] = {}
+
+    def _reserve_guess(self, conn, user_id: int, now: float) -> tuple[float, Optional[int]]:
+        """Проверяет лимит и сразу записывает попытку (одна транзакция).
+
+        Возвращает (retry_after, None), если лимит исчерпан, иначе (0, id попытки).
+        Попытка записывается до поиска кода, чтобы параллельные запросы из
+        разных воркеров не проскочили лимит; верный код ее потом удаляет.
+        """
+        window_start = now - self.guess_window
+        conn.execute("DELETE FROM promo_guesses WHERE attempted_at <= ?", (window_start,))
+        row = conn.execute('''
+            SELECT attempted_at FROM promo_guesses
+            WHERE telegram_id = ? AND attempted_at > ?
+            ORDER BY attempted_at DESC LIMIT 1 OFFSET ?
+        ''', (user_id, window_start, self.guess_limit - 1)).fetchone()
+        if row is not None:
+            return max(row[0] + self.guess_window - now, 0.001), None
+        guess_id = conn.execute(
+            "INSERT INTO promo_guesses (telegram_id, attempted_at) VALUES (?, ?)", (user_id, now)
+        ).lastrowid
+        return 0.0, guess_id
+
+    def _remember_unknown(self, code: str, now: float):
+        self._unknown.pop(code, None)
+        if len(self._unknown) >= self.MAX_NEGATIVE:
+            # Записи идут в порядке добавления — первая самая старая
+            del self._unknown[next(iter(self._unknown))]
+        self._unknown[code] = now + self.negative_ttl
+
+    async def _lookup(self, code: str, now: float) -> Optional[Promo]:
+        cached = self._active.get(code)
+        if cached is not None and cached[1] > now:
+            return cached[0]
+        expires = self._unknown.get(code)
+        if expires is not None and expires > now:
+            return None
+
+        row = await db.fetchone("SELECT discount, usage_limit FROM promo_codes WHERE code = ?", (code,))
+        if row is None:
+            self._active.pop(code, None)
+            self._remember_unknown(code, now)
+            return None
+        self._unknown.pop(code, None)
+        promo = Promo(code, *row)
+        self._active[code] = (promo, now + self.positive_ttl)
+        return promo
+
+    async def check(self, user_id: int, code: str) -> PromoCheck:
+        """Проверяет код, введенный пользователем."""
+        retry_after, guess_id = await db.transaction(self._reserve_guess, user_id, time.time())
+        if guess_id is None:
+            return PromoCheck(PROMO_RATE_LIMITED, retry_after=retry_after)
+
+        promo = await self._lookup(code, time.monotonic())
+        if promo is None:
+            logger.debug("Пользователь %s ввел несуществующий промокод", user_id)
+            return PromoCheck(PROMO_UNKNOWN)
+        # Лимит тратят только неудачные попытки: подбор упирается в него,
+        # а обычный пользователь с верным кодом его не замечает
+        await db.execute("DELETE FROM promo_guesses WHERE id = ?", (guess_id,))
+        if promo.usage_limit <= 0:
+            return PromoCheck(PROMO_EXHAUSTED, promo)
+        return PromoCheck(PROMO_ACTIVE, promo)
+
+    def forget(self, code: str):
+        """Код изменился в этом процессе (добавлен, использован) — следующий запрос перечитает его из БД."""
+        self._active.pop(code, None)
+        self._unknown.pop(code, None)
+
+
+promo_registry = PromoRegistry(
+    config.PROMO_CACHE_TTL, config.PROMO_NEGATIVE_TTL, config.PROMO_GUESS_LIMIT, config.PROMO_GUESS_WINDOW
+)
+
+
+async def add_promo_code(code: str, discount: float, usage_limit: int):
+    await db.execute(
+        "INSERT INTO promo_codes (code, discount, usage_limit) VALUES (?, ?, ?)",
+        (code, discount, usage_limit)
+    )
+    promo_registry.forget(code)
+
+
+async def activate_promo_code(user_id: int, code: str):
+    """Привязывает код к пользователю; скидка применится и код спишется при покупке."""
+    await db.execute("UPDATE users SET promo_code = ? WHERE telegram_id = ?", (code, user_id))
@@ -0,0 +1,94 @@
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from database.db import db
+from functions.catalog import catalog_cache
+from functions.ledger import SOURCE_PURCHASE, post_entry, to_cents
+from functions.promo import promo_registry, redeem_promo
+
+
+logger = logging.getLogger(__name__)
+
+PURCHASE_OK = "ok"
+PURCHASE_SOLD_OUT = "sold_out"
+PURCHASE_INSUFFICIENT_FUNDS = "insufficient_funds"
+
+
+@dataclass
+class PurchaseResult:
+    status: str
+    product: Optional[tuple] = None  # (ip, login, password, cores, ram, ssd, geo, price)
+    price: Optional[float] = None
+    promo_code: Optional[str] = None  # код, который был привязан к пользователю и сгорел с покупкой
+
+
+class _PurchaseAborted(Exception):
+    """Откатывает транзакцию покупки, унося с собой результат."""
+
+    def __init__(self, result: PurchaseResult):
+        super().__init__(result.status)
+        self.result = result
+
+
+def _purchase(conn, user_id, product_id):
+    # Товар забирает тот, чей DELETE сработал первым — второй покупатель
+    # получит пустой RETURNING и "товар уже куплен"
+    product = conn.execute('''
+        DELETE FROM products WHERE id = ?
+        RETURNING ip, login, password, cores, ram, ssd, geo, price
+    ''', (product_id,)).fetchone()
+    if not product:
+        return PurchaseResult(PURCHASE_SOLD_OUT)
+
+    ip, login, password, cores, ram, ssd, geo, price = product
+
+    # Промокод списывается тем же условным UPDATE, что проверяет остаток:
+    # исчерпанный код не дает скидку, даже если его ввели одновременно несколько человек
+    row = conn.execute("SELECT promo_code FROM users WHERE telegram_id = ?", (user_id,)).fetchone()
+    promo_code = row[0] if row else None
+    if promo_code:
+        discount = redeem_promo(conn, promo_code)
+        if discount is not None:
+            price = round(price * (1 - discount / 100), 2)
+        conn.execute("UPDATE users SET promo_code = NULL WHERE telegram_id = ?", (user_id,))
+
+    purchase_id = conn.execute(
+        "INSERT INTO purchases (telegram_id, ip, login, password, cores, ram, ssd, geo, price) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (user_id, ip, login, password, cores, ram, ssd, geo, price)
+    ).lastrowid
+
+    # Списание только при достаточном балансе: проверка и запись — одним запросом;
+    # в журнале движение ссылается на запись покупки
+    price_cents = to_cents(price)
+    balance_cents = post_entry(conn, user_id, -price_cents, SOURCE_PURCHASE, str(purchase_id), require_funds=True)
+    if balance_cents is None:
+        raise _PurchaseAborted(PurchaseResult(PURCHASE_INSUFFICIENT_FUNDS, price=price))
+    conn.execute('''
+        UPDATE users SET
+            purchase_count = purchase_count + 1,
+            total_spent_cents = total_spent_cents + ?,
+            last_purchase_at = CURRENT_TIMESTAMP
+        WHERE telegram_id = ?
+    ''', (price_cents, user_id))
+
+    return PurchaseResult(PURCHASE_OK, (ip, login, password, cores, ram, ssd, geo, price), price, promo_code)
+
+
+async def purchase_product(user_id: int, product_id: int) -> PurchaseResult:
+    """Покупает товар одной транзакцией: товар, баланс, промокод и запись покупки.
+
+    Либо применяется все сразу, либо ничего (товар остается в наличии,
+    промокод не сгорает).
+    """
+    try:
+        result = await db.transaction(_purchase, user_id, product_id)
+    except _PurchaseAborted as e:
+        result = e.result
+    if result.status != PURCHASE_INSUFFICIENT_FUNDS:
+        # Товар продан (сейчас или раньше) — убираем его из кэша каталога
+        catalog_cache.discard(product_id)
+    if result.promo_code:
+        promo_registry.forget(result.promo_code)
+    logger.debug("Покупка товара %s пользователем %s: %s", product_id, user_id, result.status)
+    return result
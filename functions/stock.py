@@ -0,0 +1,197 @@
+import asyncio
+import csv
+import logging
+import os
+import re
+import tempfile
+from dataclasses import dataclass, field
+from typing import Optional
+
+from database.db import db
+from functions.catalog import CatalogFilter, CatalogPage, DIRECTION_NEXT, catalog_cache, _fetch_page
+
+
+logger = logging.getLogger(__name__)
+
+# Удаление идет порциями в отдельных коротких транзакциях, чтобы покупки
+# не ждали блокировку записи, пока снимается большой объем товара.
+DELETE_CHUNK_SIZE = 500
+MAX_ID_RANGES = 200
+
+INVENTORY_COLUMNS = "id, ip, login, password, cores, ram, ssd, geo, price, added_at"
+INVENTORY_HEADER = ["id", "ip", "login", "password", "cores", "ram", "ssd", "geo", "price", "added_at"]
+EXPORT_FETCH_SIZE = 1000
+
+
+@dataclass(frozen=True)
+class StockSelection:
+    """Набор товаров для снятия с продажи: диапазоны id и/или фильтры."""
+    id_ranges: tuple = ()  # ((low, high), ...)
+    flt: CatalogFilter = field(default_factory=CatalogFilter)
+    older_than_days: Optional[int] = None
+    max_id: Optional[int] = None  # граница, зафиксированная при предпросмотре
+
+    def is_empty(self) -> bool:
+        return not self.id_ranges and self.flt.is_empty() and self.older_than_days is None
+
+    def where(self):
+        clauses, params = self.flt.where()
+        if self.id_ranges:
+            clauses.append("(" + " OR ".join("id BETWEEN ? AND ?" for _ in self.id_ranges) + ")")
+            for low, high in self.id_ranges:
+                params.extend((low, high))
+        if self.older_than_days is not None:
+            clauses.append("added_at < datetime('now', ?)")
+            params.append(f"-{self.older_than_days} days")
+        if self.max_id is not None:
+            clauses.append("id <= ?")
+            params.append(self.max_id)
+        return clauses, params
+
+    def with_max_id(self, max_id: int) -> "StockSelection":
+        return StockSelection(self.id_ranges, self.flt, self.older_than_days, max_id)
+
+    @classmethod
+    def parse(cls, text: str) -> "StockSelection":
+        """Разбирает ввод вида `1-100, 205 geo=NL price=5 older=30`.
+
+        Числа и диапазоны — id товаров, price=5 — точная цена, price=5-10 — диапазон,
+        older=N — товары, добавленные больше N дней назад.
+        """
+        ranges = []
+        kwargs = {}
+        older_than_days = None
+        for token in filter(None, re.split(r"[\s,]+", text)):
+            if "=" in token:
+                key, _, value = token.partition("=")
+                key = key.lower()
+                if key == "geo":
+                    kwargs["geo"] = value.upper()
+                elif key in ("cores", "ram", "ssd"):
+                    kwargs[key] = int(value)
+                elif key == "price":
+                    low, sep, high = value.partition("-")
+                    if not sep:
+                        high = low  # одна цена — точное совпадение
+                    kwargs["price_min"] = float(low) if low else None
+                    kwargs["price_max"] = float(high) if high else None
+                elif key == "older":
+                    older_than_days = int(value)
+                else:
+                    raise ValueError(f"Неизвестный фильтр: {key}")
+            else:
+                low, _, high = token.partition("-")
+                low = int(low)
+                high = int(high) if high else low
+                ranges.append((min(low, high), max(low, high)))
+        if len(ranges) > MAX_ID_RANGES:
+            raise ValueError(f"Слишком много диапазонов id (максимум {MAX_ID_RANGES})")
+        return cls(_merge_ranges(ranges), CatalogFilter(**kwargs), older_than_days)
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for low, high in sorted(ranges):
+        if merged and low <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+        else:
+            merged.append((low, high))
+    return tuple(merged)
+
+
+@dataclass
+class StockPreview:
+    count: int
+    max_id: Optional[int]
+
+
+async def preview_removal(selection: StockSelection) -> StockPreview:
+    """Пробный прогон: сколько товаров попадает под выборку (без изменений)."""
+    if selection.is_empty():
+        raise ValueError("Пустая выборка: укажите id или фильтры")
+    clauses, params = selection.where()
+    sql = "SELECT count(*), max(id) FROM products WHERE " + " AND ".join(clauses)
+    count, max_id = await db.fetchone(sql, params)
+    return StockPreview(count, max_id)
+
+
+def _delete_chunk(conn, selection, after_id, limit):
+    clauses, params = selection.where()
+    sql = (
+        "DELETE FROM products WHERE id IN ("
+        "SELECT id FROM products WHERE id > ? AND " + " AND ".join(clauses) +
+        " ORDER BY id LIMIT ?) RETURNING id"
+    )
+    return [row[0] for row in conn.execute(sql, [after_id] + params + [limit]).fetchall()]
+
+
+async def remove_stock(selection: StockSelection, chunk_size: int = DELETE_CHUNK_SIZE) -> int:
+    """Удаляет выбранные товары порциями по chunk_size. Возвращает число удаленных."""
+    if selection.is_empty():
+        raise ValueError("Пустая выборка: укажите id или фильтры")
+
+    deleted = 0
+    after_id = 0
+    while True:
+        ids = await db.transaction(_delete_chunk, selection, after_id, chunk_size)
+        if not ids:
+            break
+        catalog_cache.discard(*ids)
+        deleted += len(ids)
+        after_id = max(ids)
+        if len(ids) < chunk_size:
+            break
+        # Между порциями отдаем управление циклу событий и блокировку — покупкам
+        await asyncio.sleep(0)
+
+    logger.info("Снято с продажи товаров: %s", deleted)
+    return deleted
+
+
+async def get_inventory_page(cursor: Optional[int] = None, direction: str = DIRECTION_NEXT,
+                             limit: int = 20) -> CatalogPage:
+    """Страница склада для админа (полные строки товаров, курсор по id)."""
+    page = await db.run(_fetch_page, cursor, direction, CatalogFilter(), limit, INVENTORY_COLUMNS)
+    if not page.products and cursor is not None:
+        page = await db.run(_fetch_page, None, DIRECTION_NEXT, CatalogFilter(), limit, INVENTORY_COLUMNS)
+    return page
+
+
+def iter_inventory(conn, fetch_size: int = EXPORT_FETCH_SIZE):
+    """Генератор по курсору: в памяти одновременно не больше fetch_size строк."""
+    cursor = conn.execute(f"SELECT {INVENTORY_COLUMNS} FROM products ORDER BY id")
+    try:
+        while True:
+            rows = cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cursor.close()
+
+
+def _export_inventory(conn, path):
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(INVENTORY_HEADER)
+        for row in iter_inventory(conn):
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+async def export_inventory_csv():
+    """Выгружает склад в CSV-файл во временном каталоге. Возвращает (путь, число строк).
+
+    Чтение идет одним запросом в WAL-режиме и не блокирует покупки.
+    Удалить файл после отправки должен вызывающий код.
+    """
+    fd, path = tempfile.mkstemp(prefix="inventory_", suffix=".csv")
+    os.close(fd)
+    try:
+        count = await db.run(_export_inventory, path)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, count
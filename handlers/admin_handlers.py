@@ -1,26 +1,31 @@
-from aiogram import Router, Bot
-from aiogram.types import Message
+from aiogram import Router
+from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram import F
+import html
 import logging
-import re
-import sqlite3
-from aiogram.enums.parse_mode import ParseMode
-from aiogram.client.bot import DefaultBotProperties 
+import os
+import tempfile
 
 from states.states import FSMStates
 from functions.functions import update_user_balance
-from functions.functions import add_product
-from keyboards.keyboards import get_admin_keyboard, main_keyboard
+from functions.ledger import from_cents, reconcile_balances
+from functions.promo import add_promo_code
+from functions.broadcast import BroadcastManager
+from functions.product_import import ImportResult, import_products
+from functions.stock import StockSelection, export_inventory_csv, get_inventory_page, preview_removal, remove_stock
+from keyboards.keyboards import get_admin_keyboard, get_delete_confirm_keyboard, get_inventory_keyboard, main_keyboard
 from config import config
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 admin_router = Router()
 
+IMPORT_EXTENSIONS = (".txt", ".csv")
+INVENTORY_PAGE_SIZE = 20
+
 # Проверка на администратора
 async def is_admin(user_id: int) -> bool:
     return user_id in config.admin_ids
@@ -32,56 +37,87 @@ async def add_product_handler(message: Message, state: FSMContext):
         await message.answer("У вас нет доступа к этой функции.")
         return
 
-    logger.info(f"Админ {message.from_user.id} нажал кнопку 'Добавить товар'")
+    logger.info("Админ %s нажал кнопку 'Добавить товар'", message.from_user.id)
     
     await state.set_state(FSMStates.waiting_for_product_data)
-    await message.answer("Введите товар в формате:\n`ip:login:pass:cores:ram:ssd:geo:cost`")
+    await message.answer("Введите товары в формате:\n`ip:login:pass:cores:ram:ssd:geo:cost`\n\nили отправьте файл .txt/.csv с товарами")
 
 
-@admin_router.message(FSMStates.waiting_for_product_data)
-async def process_product_data(message: Message, state: FSMContext):
+@admin_router.message(FSMStates.waiting_for_product_data, F.document)
+async def process_product_file(message: Message, state: FSMContext):
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет доступа к этой функции.")
         return
 
-    logger.info(f"Админ {message.from_user.id} отправил товар: {message.text}")
+    document = message.document
+    extension = os.path.splitext(document.file_name or "")[1].lower()
+    if extension not in IMPORT_EXTENSIONS:
+        await message.answer("Поддерживаются только файлы .txt и .csv.")
+        return
 
-    products = message.text.strip().splitlines()
+    logger.info("Админ %s загрузил файл товаров: %s (%s байт)", message.from_user.id, document.file_name, document.file_size)
 
-    added_count = 0
-    for product in products:
-        match = re.match(r"^(.*?):(.*?):(.*?):(\d+):(\d+):(\d+):([A-Za-z]+):([\d.]+)$", product)
-        if match:
-            ip, login, password, cores, ram, ssd, geo, price = match.groups()
+    fd, path = tempfile.mkstemp(suffix=extension)
+    os.close(fd)
+    try:
+        await message.bot.download(document, destination=path)
+        result = await import_products(path, is_csv=extension == ".csv")
+    except Exception as e:
+        logger.error("Ошибка при импорте товаров: %s", e)
+        await message.answer(f"Произошла ошибка при импорте товаров: {e}")
+        return
+    finally:
+        os.remove(path)
 
-            logger.info(f"Добавление товара: {ip}, {login}, {password}, {cores}, {ram}, {ssd}, {geo}, {price}")
+    await send_import_summary(message, result)
+    await state.clear()
 
-            try:
-                add_product(ip, login, password, int(cores), int(ram), int(ssd), geo.upper(), float(price))
-                added_count += 1
-            except Exception as e:
-                logger.error(f"Ошибка при добавлении товара: {e}")
-                await message.answer(f"Произошла ошибка при добавлении товара: {e}")
-                continue
-        else:
-            await message.answer(f"Неверный формат товара: {product}")
-            logger.warning(f"Неверный формат товара: {product}")
 
-    if added_count > 0:
-        await message.answer(f"Добавлено товаров: {added_count}")
-    else:
-        await message.answer("Не удалось добавить товары. Проверьте формат ввода.")
+@admin_router.message(FSMStates.waiting_for_product_data)
+async def process_product_data(message: Message, state: FSMContext):
+    if not await is_admin(message.from_user.id):
+        await message.answer("У вас нет доступа к этой функции.")
+        return
 
+    if not message.text:
+        await message.answer("Отправьте товары текстом или файлом .txt/.csv.")
+        return
+
+    logger.info("Админ %s отправил товары: %s строк", message.from_user.id, len(message.text.splitlines()))
+
+    try:
+        result = await import_products(message.text.splitlines())
+    except Exception as e:
+        logger.error("Ошибка при добавлении товаров: %s", e)
+        await message.answer(f"Произошла ошибка при добавлении товаров: {e}")
+        return
+
+    await send_import_summary(message, result)
     await state.clear()
 
 
+async def send_import_summary(message: Message, result: ImportResult):
+    try:
+        if result.added > 0:
+            text = f"Добавлено товаров: {result.added}"
+        else:
+            text = "Не удалось добавить товары. Проверьте формат ввода."
+        if result.rejected:
+            text += f"\nОтклонено строк: {result.rejected} (список во вложении)"
+            await message.answer_document(FSInputFile(result.report_path, filename="rejected.txt"), caption=text)
+        else:
+            await message.answer(text)
+    finally:
+        result.cleanup()
+
+
 @admin_router.message(F.text == "💳 Изменить баланс пользователя")
 async def change_balance_handler(message: Message, state: FSMContext):
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет доступа к этой функции.")
         return
 
-    logger.info(f"Админ {message.from_user.id} нажал кнопку 'Изменить баланс'")
+    logger.info("Админ %s нажал кнопку 'Изменить баланс'", message.from_user.id)
 
     await message.answer("Введите ID пользователя и новый баланс через пробел. Пример: `123456789 100.50`")
 
@@ -95,7 +131,7 @@ async def process_balance_update(message: Message, state: FSMContext):
         return
 
 
-    logger.info(f"Админ {message.from_user.id} отправил запрос на изменение баланса: {message.text}")
+    logger.info("Админ %s отправил запрос на изменение баланса: %s", message.from_user.id, message.text)
 
 
     try:
@@ -103,8 +139,11 @@ async def process_balance_update(message: Message, state: FSMContext):
         user_id = int(user_id_str)
         new_balance = float(new_balance_str)
 
-        update_user_balance(user_id, new_balance)
-        await message.answer(f"Баланс пользователя {user_id} был успешно обновлён на {new_balance}$.")
+        balance = await update_user_balance(user_id, new_balance)
+        if balance is None:
+            await message.answer(f"Пользователь {user_id} не найден или его баланс стал бы отрицательным.")
+        else:
+            await message.answer(f"Баланс пользователя {user_id} был успешно обновлён на {new_balance}$. Текущий баланс: {balance:.2f}$.")
     except ValueError:
         await message.answer("Неверный формат. Пожалуйста, введите ID пользователя и новый баланс через пробел. Пример: `123456789 100.50`")
     except Exception as e:
@@ -113,6 +152,27 @@ async def process_balance_update(message: Message, state: FSMContext):
     await state.clear()
 
 
+@admin_router.message(Command("reconcile"))
+async def reconcile_balances_handler(message: Message):
+    """Сверка снимков балансов с журналом движений."""
+    if not await is_admin(message.from_user.id):
+        await message.answer("У вас нет доступа к этой функции.")
+        return
+
+    mismatches = await reconcile_balances()
+    if not mismatches:
+        await message.answer("✅ Балансы всех пользователей сходятся с журналом.")
+        return
+
+    lines = [
+        f"{m.telegram_id}: баланс {from_cents(m.balance_cents):.2f}$, по журналу {from_cents(m.ledger_cents):.2f}$"
+        for m in mismatches[:30]
+    ]
+    if len(mismatches) > 30:
+        lines.append(f"... и еще {len(mismatches) - 30}")
+    await message.answer(f"❌ Расхождений: {len(mismatches)}\n\n" + "\n".join(lines))
+
+
 @admin_router.message(F.text =="🛠 Удалить товар")
 async def delete_product_handler(message: Message, state: FSMContext):
     """Запрос на удаление товара."""
@@ -121,79 +181,147 @@ async def delete_product_handler(message: Message, state: FSMContext):
         return
 
 
-    logger.info(f"Админ {message.from_user.id} нажал кнопку 'Удалить товар'")
+    logger.info("Админ %s нажал кнопку 'Удалить товар'", message.from_user.id)
 
 
     await state.set_state(FSMStates.waiting_for_product_id)
-    await message.answer("Введите ID товаров через запятую(пример: 1, 2, 3), которые вы хотите удалить: ")
+    await message.answer(
+        "Укажите, какие товары удалить:\n"
+        "• ID и диапазоны: `1, 2, 10-500`\n"
+        "• фильтры: `geo=NL`, `price=5` или `price=5-10`, `older=30` (добавлены больше 30 дней назад)\n"
+        "Условия можно совмещать: `100-900 geo=NL`"
+    )
 
 
 @admin_router.message(FSMStates.waiting_for_product_id)
 async def process_deleting_products(message: Message, state: FSMContext):
-    """Удаление товаров по ID и перенумерация товаров."""
-    ids_text = message.text.strip()
+    """Пробный прогон удаления: показывает, сколько товаров попадет под выборку."""
+    query = (message.text or "").strip()
 
     try:
-        product_ids = [int(id.strip()) for id in ids_text.split(',')]
-
-        conn = sqlite3.connect('vds_shop.db')
-        cursor = conn.cursor()
-
-        deleted_count = 0
-        for product_id in product_ids:
-            cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-            product = cursor.fetchone()
+        selection = StockSelection.parse(query)
+        preview = await preview_removal(selection)
+    except ValueError as e:
+        await message.answer(f"Не удалось разобрать запрос: {e}\nПопробуйте еще раз.")
+        return
+    except Exception as e:
+        logger.error("Ошибка при подсчете товаров для удаления: %s", e)
+        await message.answer(f"Произошла ошибка при подсчете товаров: {e}")
+        await state.clear()
+        return
 
-            if product:
-                cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-                deleted_count += 1
+    if preview.count == 0:
+        await message.answer("Товары по заданным условиям не найдены.", reply_markup=get_admin_keyboard())
+        await state.clear()
+        return
 
-        conn.commit()
+    # Граница max_id не дает удалить товары, добавленные после предпросмотра
+    await state.update_data(delete_query=query, delete_max_id=preview.max_id)
+    await state.set_state(FSMStates.waiting_for_delete_confirm)
+    await message.answer(
+        f"Будет удалено товаров: {preview.count}. Подтвердите удаление.",
+        reply_markup=get_delete_confirm_keyboard()
+    )
 
-        if deleted_count > 0:
-            await message.answer(f"Удалено {deleted_count} товара(ов).")
-        else:
-            await message.answer("Товары с указанными ID не найдены.")
 
+@admin_router.callback_query(FSMStates.waiting_for_delete_confirm, F.data == "stock_delete_confirm")
+async def confirm_deleting_products(callback: CallbackQuery, state: FSMContext):
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("У вас нет доступа к этой функции.")
+        return
 
+    data = await state.get_data()
+    await state.clear()
+    await callback.message.edit_text("Удаление товаров...")
+    await callback.answer()
 
-    except ValueError:
-        await message.answer("Пожалуйста, введите корректные ID товаров (целые числа, разделенные запятой).")
+    try:
+        selection = StockSelection.parse(data["delete_query"]).with_max_id(data["delete_max_id"])
+        deleted_count = await remove_stock(selection)
     except Exception as e:
-        await message.answer(f"Произошла ошибка при удалении товаров: {e}")
+        logger.error("Ошибка при удалении товаров: %s", e)
+        await callback.message.edit_text(f"Произошла ошибка при удалении товаров: {e}")
+        return
 
+    logger.info("Админ %s удалил %s товаров по запросу '%s'", callback.from_user.id, deleted_count, data['delete_query'])
+    await callback.message.edit_text(f"Удалено {deleted_count} товара(ов).")
 
-    await message.answer("Выберите действие:", reply_markup=get_admin_keyboard())
 
+@admin_router.callback_query(F.data == "stock_delete_cancel")
+async def cancel_deleting_products(callback: CallbackQuery, state: FSMContext):
     await state.clear()
+    await callback.message.edit_text("Удаление отменено.")
+    await callback.answer()
 
 
 @admin_router.message(F.text =="📝 Список товаров")
 async def list_products_handler(message: Message):
-    """Выводит список всех товаров в базе данных."""
+    """Выводит первую страницу склада с навигацией и выгрузкой в CSV."""
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет доступа к этой функции.")
         return
 
 
-    logger.info(f"Админ {message.from_user.id} запросил список товаров")
+    logger.info("Админ %s запросил список товаров", message.from_user.id)
 
 
-    conn = sqlite3.connect('vds_shop.db')
-    cursor = conn.cursor()
+    page = await get_inventory_page(limit=INVENTORY_PAGE_SIZE)
 
-    cursor.execute("SELECT * FROM products")
-    products = cursor.fetchall()
-    
+    if page.products:
+        await message.answer(format_inventory_page(page), reply_markup=get_inventory_keyboard(page))
+    else:
+        await message.answer("В базе данных нет товаров.")
 
 
-    if products:
-        product_list = "\n".join([f"{item[0]}:{item[1]}:{item[2]}:{item[3]}:{item[4]}:{item[5]}:{item[6]}:{item[7]}:{item[8]}"
-                                for item in products])
-        await message.answer(f"Список товаров:\n\n{product_list}")
+@admin_router.callback_query(F.data.startswith("inv_"))
+async def inventory_callback(callback: CallbackQuery):
+    if not await is_admin(callback.from_user.id):
+        await callback.answer("У вас нет доступа к этой функции.")
+        return
+
+    if callback.data == "inv_export":
+        await callback.answer("Готовим выгрузку...")
+        path, count = await export_inventory_csv()
+        try:
+            await callback.message.answer_document(
+                FSInputFile(path, filename="inventory.csv"),
+                caption=f"Товаров на складе: {count}"
+            )
+        finally:
+            os.remove(path)
+        return
+
+    _, direction, cursor = callback.data.split("_")
+    page = await get_inventory_page(int(cursor), direction, INVENTORY_PAGE_SIZE)
+    if page.products:
+        await callback.message.edit_text(format_inventory_page(page), reply_markup=get_inventory_keyboard(page))
     else:
-        await message.answer("В базе данных нет товаров.")
-    
+        await callback.message.edit_text("В базе данных нет товаров.")
+    await callback.answer()
+
+
+def escape_truncated(text: str, limit: int) -> str:
+    """html.escape(text), обрезанный до limit символов без разрыва сущностей вроде &amp;."""
+    parts = []
+    size = 0
+    for char in text:
+        escaped = html.escape(char)
+        if size + len(escaped) > limit:
+            break
+        parts.append(escaped)
+        size += len(escaped)
+    return "".join(parts)
+
+
+def format_inventory_page(page) -> str:
+    # 20 строк по 180 символов уже после экранирования укладываются в лимит
+    # Telegram в 4096 символов (пароли с &<>"' при экранировании растут до 6 раз)
+    product_list = "\n".join(
+        escape_truncated(":".join(str(value) for value in item[:9]), 180)
+        for item in page.products
+    )
+    return f"Список товаров:\n\n{product_list}"
+
 @admin_router.message(F.text == "⬅️ Назад")
 async def back_to_main_menu(message: Message, state: FSMContext):
     """Возвращаем пользователя в основное меню."""
@@ -221,10 +349,7 @@ async def get_promo_code_handler(message: Message, state: FSMContext):
 
     try:
         code, discount, usage_limit = message.text.split(":")
-        conn = sqlite3.connect("vds_shop.db")
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO promo_codes (code, discount, usage_limit) VALUES (?, ?, ?)", (code, float(discount), int(usage_limit)))
-        conn.commit()
+        await add_promo_code(code, float(discount), int(usage_limit))
         await message.answer("Промокод добавлен.")
     except Exception as e:
         await message.answer(f"Ошибка: {e}")
@@ -243,31 +368,14 @@ async def broadcast_message(message: Message, state: FSMContext):
 
 
 @admin_router.message(FSMStates.waiting_for_broadcast)
-async def process_broadcast_message(message: Message, state: FSMContext):
+async def process_broadcast_message(message: Message, state: FSMContext, broadcasts: BroadcastManager):
     if not await is_admin(message.from_user.id):
         await message.answer("У вас нет доступа к этой функции.")
         return
     
     broadcast_message = message.text.strip()
     
-    # Сохраняем сообщение в FSMContext
-    await state.update_data(broadcast_message=broadcast_message)
-    
-    # Отправляем сообщение всем пользователям
-    # Получаем всех пользователей из базы данных
-    conn = sqlite3.connect('vds_shop.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT telegram_id FROM users")
-    users = cursor.fetchall()
-    
-    if users:
-        for user in users:
-            user_id = user[0]
-            try:
-                await message.bot.send_message(user_id, broadcast_message)
-            except Exception as e:
-                print(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
-    
-    # Подтверждение администратору
-    await message.answer("Рассылка завершена.")
-    await state.clear()
\ No newline at end of file
+    # Рассылка идет в фоне: прогресс и итог придут отдельным сообщением
+    job = await broadcasts.start(message.from_user.id, broadcast_message)
+    logger.info("Админ %s запустил рассылку #%s на %s пользователей", message.from_user.id, job.id, job.total)
+    await state.clear()
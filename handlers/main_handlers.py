@@ -1,39 +1,49 @@
+import html
+import os
+
 from aiogram import Router
-from aiogram.types import Message, CallbackQuery
-from aiogram.filters import Command
+from aiogram.types import Message, CallbackQuery, FSInputFile
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram import F
-import sqlite3
 
 from config import config
-from keyboards.keyboards import main_keyboard, profile_inline_keyboard, create_products_keyboard, get_admin_keyboard, back_to_main
-from functions.functions import get_user_balance, create_user, get_user_purchase_count
+from keyboards.keyboards import main_keyboard, profile_inline_keyboard, create_products_keyboard, get_admin_keyboard, back_to_main, get_purchases_keyboard
+from functions.functions import UserStats, create_user, get_user_stats, get_user_purchases_page, export_user_purchases
 from states.states import FSMStates
+from functions.catalog import CatalogFilter
 
 main_router = Router()
 
+PURCHASES_PER_PAGE = 5
+
 
 @main_router.message(Command("start"))
 async def start_handler(message: Message):
-    create_user(message.from_user.id)
+    await create_user(message.from_user.id)
     await message.answer("Приветсутсвую в VDS Market! Выберите действие:", reply_markup=main_keyboard(message.from_user.id))
 
 @main_router.message(F.text == "Профиль")
 async def profile_handler(message: Message):
-    balance = get_user_balance(message.from_user.id)
-    purchase_count = get_user_purchase_count(message.from_user.id)
+    stats = await get_user_stats(message.from_user.id)
+    await message.answer(format_profile(message.from_user.id, stats), reply_markup=profile_inline_keyboard)
+
 
+def format_profile(user_id: int, stats: UserStats) -> str:
     text = (f"👤 <b>Ваш профиль</b>\n"
-        f"🆔 ID: <i>{message.from_user.id}</i>\n"
-        f"💰 Баланс: <i>{balance:.2f}$</i>\n"
-        f"🛒 Куплено товаров: <i>{purchase_count}</i>")
-    await message.answer(text, reply_markup=profile_inline_keyboard)
+        f"🆔 ID: <i>{user_id}</i>\n"
+        f"💰 Баланс: <i>{stats.balance:.2f}$</i>\n"
+        f"🛒 Куплено товаров: <i>{stats.purchase_count}</i>\n"
+        f"💸 Потрачено: <i>{stats.total_spent:.2f}$</i>\n"
+        f"📥 Пополнено: <i>{stats.total_topped_up:.2f}$</i>")
+    if stats.last_purchase_at:
+        text += f"\n🕒 Последняя покупка: <i>{stats.last_purchase_at}</i>"
+    return text
 
 
 @main_router.message(F.text == "📜 Товары")
 async def products_handler(message: Message):
-    page = 0
-    keyboard = create_products_keyboard(page)
+    keyboard = await create_products_keyboard()
     await message.answer("""🖥 Дедики в наличии
 
 ⚡️ Для покупки выберите интересующий дедик и удобный вам способ оплаты. После оплаты вы мгновенно получаете данные от дедика.
@@ -44,6 +54,24 @@ async def products_handler(message: Message):
 """, reply_markup=keyboard)
 
 
+@main_router.message(Command("filter"))
+async def filter_products_handler(message: Message, command: CommandObject):
+    """Каталог с фильтром: /filter geo=NL cores=4 ram=8 ssd=100 price=5-20"""
+    try:
+        flt = CatalogFilter.parse(command.args or "")
+    except ValueError:
+        await message.answer(
+            "Неверный фильтр. Пример: <code>/filter geo=NL cores=4 ram=8 ssd=100 price=5-20</code>"
+        )
+        return
+
+    keyboard = await create_products_keyboard(flt=flt)
+    if not keyboard.inline_keyboard:
+        await message.answer("❌ Нет товаров, подходящих под фильтр.")
+        return
+    await message.answer("🖥 Дедики по фильтру:", reply_markup=keyboard)
+
+
 @main_router.message(F.text == "Информация")
 async def products_handler(message: Message):
     await message.answer("По любым вопросам писать - @romauuka")
@@ -53,28 +81,48 @@ async def products_handler(message: Message):
 async def my_vds_handler(message: Message):
     user_id = message.from_user.id
     
-    conn = sqlite3.connect("vds_shop.db")
-    cursor = conn.cursor()
+    page = await get_user_purchases_page(user_id, limit=PURCHASES_PER_PAGE)
 
-    cursor.execute("SELECT ip, login, password, cores, ram, ssd, geo, price FROM purchases WHERE telegram_id = ?", (user_id,))
-    purchases = cursor.fetchall()
-
-
-
-    if purchases:
-        purchase_list = "\n\n".join([
-            f"🔹 <b>IP:</b> {ip}\n"
-            f"🔹 <b>Логин:</b> {login}\n"
-            f"🔹 <b>Пароль:</b> {password}\n"
-            f"🔹 <b>{cores} Ядер | {ram}GB RAM | {ssd}GB SSD</b>\n"
-            f"💰 <b>Цена:</b> {price}$"
-            for ip, login, password, cores, ram, ssd, geo, price in purchases
-        ])
-        
-        await message.answer(f"🖥 <b>Ваши купленные VDS:</b>\n\n{purchase_list}")
+    if page.products:
+        await message.answer(format_purchases_page(page), reply_markup=get_purchases_keyboard(page))
     else:
         await message.answer("❌ У вас нет купленных VDS.")
 
+
+@main_router.callback_query(F.data.startswith("vds_"))
+async def my_vds_callback(callback: CallbackQuery):
+    user_id = callback.from_user.id
+
+    if callback.data == "vds_export":
+        await callback.answer("Готовим файл...")
+        path, count = await export_user_purchases(user_id)
+        try:
+            await callback.message.answer_document(
+                FSInputFile(path, filename="my_vds.csv"),
+                caption=f"🖥 Всего купленных VDS: {count}"
+            )
+        finally:
+            os.remove(path)
+        return
+
+    _, direction, cursor = callback.data.split("_")
+    page = await get_user_purchases_page(user_id, int(cursor), direction, PURCHASES_PER_PAGE)
+    if page.products:
+        await callback.message.edit_text(format_purchases_page(page), reply_markup=get_purchases_keyboard(page))
+    await callback.answer()
+
+
+def format_purchases_page(page) -> str:
+    purchase_list = "\n\n".join([
+        f"🔹 <b>IP:</b> {html.escape(ip)}\n"
+        f"🔹 <b>Логин:</b> {html.escape(login)}\n"
+        f"🔹 <b>Пароль:</b> {html.escape(password)}\n"
+        f"🔹 <b>{cores} Ядер | {ram}GB RAM | {ssd}GB SSD</b>\n"
+        f"💰 <b>Цена:</b> {price}$"
+        for _, ip, login, password, cores, ram, ssd, geo, price, _ in page.products
+    ])
+    return f"🖥 <b>Ваши купленные VDS:</b>\n\n{purchase_list}"
+
 @main_router.message(F.text == "Промокод")
 async def promo_code_handler(message: Message, state: FSMContext):
     await message.answer("Введите промокод:", reply_markup=back_to_main())
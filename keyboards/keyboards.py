@@ -1,6 +1,6 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from config import config
-from functions.functions import get_products
+from functions.catalog import catalog_cache, CatalogFilter, DIRECTION_NEXT, DIRECTION_PREV
 from functions.functions import get_flag
 
 # Главная клавиатура
@@ -53,13 +53,22 @@ def get_admin_keyboard():
 
 ITEMS_PER_PAGE = 7
 
-def create_products_keyboard(page: int):
-    offset = page * ITEMS_PER_PAGE
-    products = get_products(offset, ITEMS_PER_PAGE)
+async def create_products_keyboard(cursor: int = None, direction: str = DIRECTION_NEXT, flt: CatalogFilter = None):
+    flt = flt or CatalogFilter()
+    encoded_filter = flt.encode()
+
+    # Собранные страницы живут в кэше каталога до первого изменения товаров
+    cache_key = (cursor, direction, encoded_filter)
+    cached = catalog_cache.get_rendered(cache_key)
+    if cached is not None:
+        return cached
+
+    version = catalog_cache.version
+    page = await catalog_cache.page(cursor, direction, flt, ITEMS_PER_PAGE)
 
     inline_keyboard = []
     
-    for product in products:
+    for product in page.products:
         product_id, cores, ram, ssd, geo, price = product
         flag = get_flag(geo)
         product_info = f"{flag} {cores} Ядер | {ram} Гб ОЗУ | {ssd} Гб SSD | {price}$"
@@ -68,17 +77,24 @@ def create_products_keyboard(page: int):
     
     navigation_buttons = []
 
-    if len(products) == ITEMS_PER_PAGE:
-        navigation_buttons.append(InlineKeyboardButton(text="➡️", callback_data=f"page_{page + 1}"))
+    if page.has_prev:
+        first_id = page.products[0][0]
+        navigation_buttons.append(InlineKeyboardButton(
+            text="◀️", callback_data=f"page_{DIRECTION_PREV}_{first_id}_{encoded_filter}"
+        ))
 
-    if page > 0:
-        navigation_buttons.insert(0, InlineKeyboardButton(text="◀️", callback_data=f"page_{page - 1}"))
+    if page.has_next:
+        last_id = page.products[-1][0]
+        navigation_buttons.append(InlineKeyboardButton(
+            text="➡️", callback_data=f"page_{DIRECTION_NEXT}_{last_id}_{encoded_filter}"
+        ))
 
     if navigation_buttons:
         inline_keyboard.append(navigation_buttons)
     
-
-    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+    catalog_cache.store_rendered(cache_key, version, keyboard)
+    return keyboard
 
 def product_buy_keyboard(product_id):
     return InlineKeyboardMarkup(
@@ -88,6 +104,48 @@ def product_buy_keyboard(product_id):
         ]
     )
 
+def get_inventory_keyboard(page) -> InlineKeyboardMarkup:
+    navigation_buttons = []
+    if page.has_prev:
+        navigation_buttons.append(InlineKeyboardButton(
+            text="◀️", callback_data=f"inv_{DIRECTION_PREV}_{page.products[0][0]}"
+        ))
+    if page.has_next:
+        navigation_buttons.append(InlineKeyboardButton(
+            text="➡️", callback_data=f"inv_{DIRECTION_NEXT}_{page.products[-1][0]}"
+        ))
+
+    inline_keyboard = []
+    if navigation_buttons:
+        inline_keyboard.append(navigation_buttons)
+    inline_keyboard.append([InlineKeyboardButton(text="📄 Выгрузить CSV", callback_data="inv_export")])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+def get_purchases_keyboard(page) -> InlineKeyboardMarkup:
+    navigation_buttons = []
+    if page.has_prev:
+        navigation_buttons.append(InlineKeyboardButton(
+            text="◀️", callback_data=f"vds_{DIRECTION_PREV}_{page.products[0][0]}"
+        ))
+    if page.has_next:
+        navigation_buttons.append(InlineKeyboardButton(
+            text="➡️", callback_data=f"vds_{DIRECTION_NEXT}_{page.products[-1][0]}"
+        ))
+
+    inline_keyboard = []
+    if navigation_buttons:
+        inline_keyboard.append(navigation_buttons)
+    inline_keyboard.append([InlineKeyboardButton(text="📄 Все покупки файлом", callback_data="vds_export")])
+    return InlineKeyboardMarkup(inline_keyboard=inline_keyboard)
+
+def get_delete_confirm_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text="🗑 Удалить", callback_data="stock_delete_confirm"),
+            InlineKeyboardButton(text="Отмена", callback_data="stock_delete_cancel")
+        ]
+    ])
+
 def get_payment_check_keyboard(payment_id: str) -> InlineKeyboardMarkup:
     if payment_id.startswith("yoo_"):
         callback_data = f"check_yoo_payment_{payment_id[4:]}"
@@ -100,7 +158,6 @@ def get_payment_check_keyboard(payment_id: str) -> InlineKeyboardMarkup:
         [InlineKeyboardButton(text="Проверить оплату", callback_data=callback_data)],
         [InlineKeyboardButton(text="Назад", callback_data="back_to_profile")]
     ])
-    print(f"Сформирован callback_data: {callback_data}")
     return keyboard
 
 def get_payment_inline_keyboard():
@@ -1,25 +1,232 @@
+import time
+
+# Отсчет холодного старта: большую его часть занимает импорт aiogram
+STARTED_AT = time.perf_counter()
+
 import asyncio
+from contextlib import contextmanager
 from aiogram import Bot, Dispatcher
-from functions.functions import create_db
+from database.db import db
+from database.migrations import migrate
+from database.fsm_storage import SQLiteStorage
+from payments.http import http_client
+from payments.currency import rate_cache
+from functions.broadcast import BroadcastManager
+from functions.catalog import catalog_cache
 from config import config
 from aiogram.enums.parse_mode import ParseMode
-from aiogram.client.bot import DefaultBotProperties 
+from aiogram.client.bot import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.client.telegram import TelegramAPIServer
 from handlers.handlers import router
-import threading
+from monitoring.middleware import TelegramRequestMetrics, setup_metrics
+from monitoring.log import setup_logging
 import logging
 
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def main():
-    create_db()
-    bot = Bot(token=config.BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    dp = Dispatcher()
+
+class StartupTimer:
+    """Длительность фаз запуска: по ней видно, что задерживает рестарт."""
+
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.phases: dict[str, float] = {}
+
+    def add(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def report(self):
+        phases = {name: round(seconds * 1000) for name, seconds in self.phases.items()}
+        logger.info(
+            "Бот запущен за %.0f мс от старта процесса (%s)",
+            (time.perf_counter() - self.started_at) * 1000,
+            ", ".join(f"{name} {ms} мс" for name, ms in phases.items()),
+            extra={"startup_ms": phases},
+        )
+
+
+startup = StartupTimer(STARTED_AT)
+startup.add("imports", time.perf_counter() - STARTED_AT)
+
+
+async def on_startup(bot: Bot, dispatcher: Dispatcher):
+    with startup.phase("database"):
+        await migrate(db)
+        await rate_cache.load()
+    broadcasts = BroadcastManager(
+        bot, config.BROADCAST_RATE, config.BROADCAST_CONCURRENCY, config.BROADCAST_CHUNK_SIZE,
+        config.BROADCAST_LEASE_TIMEOUT,
+    )
+    dispatcher["broadcasts"] = broadcasts
+    # Кэш каталога подтягивает покупки и импорт из других процессов;
+    # сам каталог загружается в фоне и не задерживает старт
+    retention = config.CATALOG_CHANGES_RETENTION if dispatcher["background_tasks"] else None
+    catalog_cache.start(config.CATALOG_SYNC_INTERVAL, retention)
+    # Курс из API получает один процесс, остальные перечитывают его из БД
+    rate_cache.start(fetch=dispatcher["background_tasks"])
+    # Фоновые задачи нужны в одном экземпляре, а не в каждом воркере
+    if dispatcher["background_tasks"]:
+        with startup.phase("background"):
+            from payments.reconciler import PaymentReconciler
+
+            # С вебхуками платежей сверка нужна только как страховка от потерянных уведомлений
+            interval = config.RECONCILE_WEBHOOK_INTERVAL if config.PAYMENT_WEBHOOKS else config.RECONCILE_INTERVAL
+            reconciler = PaymentReconciler(
+                bot, interval, config.RECONCILE_BATCH_SIZE, config.RECONCILE_CONCURRENCY
+            )
+            reconciler.start()
+            dispatcher["reconciler"] = reconciler
+            dispatcher.storage.start()
+            # Рассылки из всех воркеров выполняются здесь, под одним лимитом скорости
+            broadcasts.start_runner()
+    if config.METRICS_PORT:
+        with startup.phase("metrics"):
+            from monitoring.server import start_metrics_server
+
+            # У каждого воркера свои метрики и свой порт: METRICS_PORT + номер воркера
+            port = config.METRICS_PORT + dispatcher["worker_id"]
+            dispatcher["metrics_server"] = await start_metrics_server(config.METRICS_HOST, port)
+    startup.report()
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    broadcasts = dispatcher.workflow_data.pop("broadcasts", None)
+    if broadcasts is not None:
+        await broadcasts.stop()
+    reconciler = dispatcher.workflow_data.pop("reconciler", None)
+    if reconciler is not None:
+        await reconciler.stop()
+    metrics_server = dispatcher.workflow_data.pop("metrics_server", None)
+    if metrics_server is not None:
+        await metrics_server.cleanup()
+    await rate_cache.stop()
+    await catalog_cache.stop()
+    await http_client.close()
+    await db.close()
+
+
+def create_bot(session: BaseSession = None) -> Bot:
+    if session is None and config.TELEGRAM_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(config.TELEGRAM_API_URL))
+    bot = Bot(token=config.BOT_TOKEN, session=session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(TelegramRequestMetrics())
+    return bot
+
+
+def create_dispatcher(background_tasks: bool = True, worker_id: int = 0) -> Dispatcher:
+    # Состояния диалогов в общей БД: переживают перезапуск и видны всем воркерам
+    storage = SQLiteStorage(db, config.FSM_STATE_TTL, config.FSM_CLEANUP_INTERVAL)
+    dp = Dispatcher(storage=storage)
+    dp["background_tasks"] = background_tasks
+    dp["worker_id"] = worker_id
+    setup_metrics(dp)
     dp.include_router(router)
-    
-    logger.info("Бот запущен!")
-    await dp.start_polling(bot)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+
+def create_app(background_tasks: bool = True, worker_id: int = 0,
+               session: BaseSession = None) -> tuple[Bot, Dispatcher]:
+    """Собирает приложение процесса: один Bot и диспетчер со всеми роутерами.
+
+    Пул БД (database.db.db) и HTTP-клиент провайдеров (payments.http.http_client)
+    общие на процесс: пул открывается миграциями на старте, HTTP-сессия —
+    при первом запросе к провайдеру. Закрываются они в on_shutdown.
+    """
+    with startup.phase("bot"):
+        bot = create_bot(session)
+    with startup.phase("dispatcher"):
+        dp = create_dispatcher(background_tasks, worker_id)
+    return bot, dp
+
+
+async def run_polling():
+    bot, dp = create_app()
+    with startup.phase("delete_webhook"):
+        await bot.delete_webhook()
+    payments_server = None
+    if config.PAYMENT_WEBHOOKS:
+        from webhooks.app import start_payments_server
+
+        payments_server = await start_payments_server(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        if payments_server is not None:
+            await payments_server.cleanup()
+
+
+def run_webhook_worker(worker_id: int):
+    """Один процесс-воркер вебхука. Воркеры делят порт через SO_REUSEPORT."""
+    from aiohttp import web
+    from webhooks.app import build_app
+
+    setup_logging()
+    bot, dp = create_app(background_tasks=worker_id == 0, worker_id=worker_id)
+    app = build_app(bot, dp)
+    logger.info("Воркер вебхука %d слушает %s:%d", worker_id, config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    web.run_app(
+        app,
+        host=config.WEBHOOK_HOST,
+        port=config.WEBHOOK_PORT,
+        reuse_port=config.WEBHOOK_WORKERS > 1,
+        print=None,
+    )
+
+
+async def register_webhook():
+    from webhooks.app import set_webhook
+
+    bot, dp = create_app()
+    try:
+        await set_webhook(bot, dp)
+    finally:
+        await bot.session.close()
+
+
+def run_webhook():
+    import multiprocessing
+
+    asyncio.run(register_webhook())
+
+    if config.WEBHOOK_WORKERS <= 1:
+        run_webhook_worker(0)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_webhook_worker, args=(worker_id,), name=f"webhook-{worker_id}")
+        for worker_id in range(config.WEBHOOK_WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        for worker in workers:
+            worker.terminate()
+
+
+def main():
+    setup_logging()
+    if config.BOT_MODE == "webhook":
+        run_webhook()
+    else:
+        asyncio.run(run_polling())
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    main()
@@ -0,0 +1,135 @@
+"""Единая настройка логирования.
+
+Логгеры пишут в очередь, а форматирование в JSON и вывод выполняет
+отдельный поток (QueueListener), поэтому event loop не ждет stderr.
+Сообщение собирается из аргументов (logger.info("... %s", x)) только
+если запись прошла фильтр уровня и выборки.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Optional
+
+from config import config
+
+
+# Атрибуты LogRecord, которые не попадают в JSON как дополнительные поля (extra=...)
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "sampled"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — один JSON-объект в строке."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        sampled = getattr(record, "sampled", None)
+        if sampled:
+            entry["sampled"] = sampled
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждую N-ю запись ниже WARNING от шумных логгеров.
+
+    rates: {"aiogram.event": 0.1} — писать 10% записей логгера и его потомков.
+    В записи остается sampled=N, чтобы при анализе можно было умножить счетчики.
+    """
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.every = {name: max(round(1 / rate), 1) for name, rate in rates.items() if rate > 0}
+        self.muted = {name for name, rate in rates.items() if rate <= 0}
+        self._seen: dict[str, int] = {}
+        self._prefixes: dict[str, Optional[str]] = {}
+
+    def _prefix(self, name: str) -> Optional[str]:
+        if name not in self._prefixes:
+            prefix = name
+            while prefix and prefix not in self.every and prefix not in self.muted:
+                prefix = prefix.rpartition(".")[0]
+            self._prefixes[name] = prefix or None
+        return self._prefixes[name]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        prefix = self._prefix(record.name)
+        if prefix is None:
+            return True
+        if prefix in self.muted:
+            return False
+        every = self.every[prefix]
+        seen = self._seen.get(prefix, 0)
+        self._seen[prefix] = seen + 1
+        if seen % every:
+            return False
+        record.sampled = every
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Текст сообщения и трейсбек собираем здесь: аргументы и exc_info
+        # могут измениться или не пережить передачу в другой поток
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Настраивает корневой логгер процесса. Повторный вызов ничего не делает."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    if config.LOG_FORMAT == "text":
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    else:
+        output.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    handler = _QueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(config.log_sample))
+
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+    root.addHandler(handler)
+    root.setLevel(config.LOG_LEVEL.upper())
+    for name, level in config.log_levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает накопившиеся записи (вызывается при выходе процесса)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
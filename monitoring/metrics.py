@@ -0,0 +1,163 @@
+"""Метрики процесса в текстовом формате Prometheus.
+
+Счетчики обновляются только из event loop (без блокировок), поэтому запись
+наблюдения стоит одного bisect и пары сложений и может быть включена всегда.
+Каждый процесс (воркер) ведет свои метрики и отдает их на своем порту.
+"""
+from bisect import bisect_left
+from typing import Callable, Optional
+
+
+# Границы корзин гистограмм латентности, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Ограничение числа рядов у метрики: неожиданные значения меток (например,
+# id в данных кнопки) попадают в общий ряд OTHER и не раздувают память
+MAX_SERIES = 500
+OTHER = "other"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value in (float("inf"), float("-inf")):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: dict[tuple, list] = {}
+
+    def _new_series(self) -> list:
+        raise NotImplementedError
+
+    def _get_series(self, labels: tuple) -> list:
+        series = self._series.get(labels)
+        if series is None:
+            if len(self._series) >= MAX_SERIES:
+                labels = (OTHER,) * len(self.labelnames)
+                series = self._series.get(labels)
+                if series is not None:
+                    return series
+            series = self._series[labels] = self._new_series()
+        return series
+
+    def _samples(self):
+        """Строки вида name{labels} value."""
+        raise NotImplementedError
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def _new_series(self) -> list:
+        return [0]
+
+    def inc(self, *labels, amount: float = 1):
+        self._get_series(labels)[0] += amount
+
+    def _samples(self):
+        for labels, series in self._series.items():
+            yield f"{self.name}_total{_format_labels(self.labelnames, labels)} {_format_value(series[0])}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_series(self) -> list:
+        # Счетчики корзин (последняя — +Inf) и сумма наблюдений
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, *labels):
+        series = self._get_series(labels)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def _samples(self):
+        for labels, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(float(bound))
+                formatted = _format_labels(self.labelnames, labels, 'le="%s"' % le)
+                yield f"{self.name}_bucket{formatted} {cumulative}"
+            formatted = _format_labels(self.labelnames, labels)
+            yield f"{self.name}_sum{formatted} {_format_value(series[-1])}"
+            yield f"{self.name}_count{formatted} {cumulative}"
+
+
+class Gauge(_Metric):
+    """Значение, которое вычисляется в момент выгрузки метрик."""
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]]):
+        super().__init__(name, documentation)
+        self.read = read
+
+    def _samples(self):
+        value = self.read()
+        if value is not None:
+            yield f"{self.name} {_format_value(float(value))}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+handler_seconds = registry.register(Histogram(
+    "bot_handler_seconds", "Время обработки апдейта по хендлерам", ("event", "handler")
+))
+handler_errors = registry.register(Counter(
+    "bot_handler_errors", "Исключения в хендлерах", ("event", "handler")
+))
+callback_seconds = registry.register(Histogram(
+    "bot_callback_seconds", "Время обработки нажатий кнопок по префиксу callback_data", ("prefix",)
+))
+db_seconds = registry.register(Histogram(
+    "bot_db_seconds", "Время запросов к БД, включая ожидание соединения из пула", ("operation",)
+))
+http_seconds = registry.register(Histogram(
+    "bot_http_seconds", "Время запросов к платежным провайдерам и API курса валют", ("provider", "outcome")
+))
+telegram_seconds = registry.register(Histogram(
+    "bot_telegram_seconds", "Время запросов к Telegram Bot API", ("method",)
+))
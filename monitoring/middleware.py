@@ -0,0 +1,79 @@
+import re
+import time
+from typing import Optional
+
+from aiogram import BaseMiddleware, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from monitoring.metrics import OTHER, callback_seconds, handler_errors, handler_seconds, telegram_seconds
+
+
+UNHANDLED = "unhandled"
+MAX_PREFIX_PARTS = 3
+
+
+def callback_prefix(data: Optional[str]) -> str:
+    """Префикс callback_data без идентификаторов: "inv_n_120" -> "inv_n", "buy_15" -> "buy"."""
+    parts = []
+    for part in re.split(r"[_:]", data or ""):
+        if not part.isalpha() or len(parts) == MAX_PREFIX_PARTS:
+            break
+        parts.append(part)
+    return "_".join(parts) or OTHER
+
+
+class _UpdateTiming:
+    __slots__ = ("handler",)
+
+    def __init__(self):
+        self.handler = UNHANDLED
+
+
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: полное время обработки (фильтры, FSM, хендлер).
+
+    Имя сработавшего хендлера сообщает HandlerNameMiddleware, который
+    вызывается уже после выбора хендлера.
+    """
+
+    async def __call__(self, handler, event, data):
+        timing = data["metrics_timing"] = _UpdateTiming()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(event.event_type, timing.handler)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            handler_seconds.observe(elapsed, event.event_type, timing.handler)
+            if event.callback_query is not None:
+                callback_seconds.observe(elapsed, callback_prefix(event.callback_query.data))
+
+
+class HandlerNameMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        timing = data.get("metrics_timing")
+        if timing is not None:
+            timing.handler = data["handler"].callback.__name__
+        return await handler(event, data)
+
+
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    """Время запросов к Bot API по методам (sendMessage, editMessageText, ...)."""
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            telegram_seconds.observe(time.perf_counter() - started, method.__api_method__)
+
+
+def setup_metrics(dp: Dispatcher):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Внутренние middleware диспетчера действуют и на вложенные роутеры
+    name_middleware = HandlerNameMiddleware()
+    for event_name, observer in dp.observers.items():
+        if event_name not in ("update", "error"):
+            observer.middleware(name_middleware)
@@ -0,0 +1,92 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+from config import config
+from payments.http import HttpClient, ProviderError, http_client
+
+
+logger = logging.getLogger(__name__)
+
+PROVIDER = "cryptobot"
+# Максимальный count у getInvoices
+MAX_PAGE_SIZE = 1000
+# Сколько id передаем в одном invoice_ids, чтобы строка запроса оставалась короткой
+IDS_PER_REQUEST = 250
+
+
+@dataclass
+class CryptoInvoice:
+    invoice_id: str
+    status: str
+    amount: float
+    pay_url: Optional[str] = None
+    payload: Optional[str] = None
+
+    @classmethod
+    def from_api(cls, data: dict) -> "CryptoInvoice":
+        return cls(
+            invoice_id=str(data["invoice_id"]),
+            status=data.get("status"),
+            amount=float(data.get("amount") or 0),
+            pay_url=data.get("pay_url") or data.get("bot_invoice_url"),
+            payload=data.get("payload"),
+        )
+
+
+class CryptoBotClient:
+    def __init__(self, http: HttpClient, token: str, base_url: str):
+        self.http = http
+        self.base_url = base_url.rstrip("/")
+        self._headers = {"Crypto-Pay-API-Token": token or ""}
+
+    async def _call(self, method: str, http_method: str = "GET", **kwargs):
+        status, data = await self.http.request(
+            PROVIDER, http_method, f"{self.base_url}/{method}", headers=self._headers, **kwargs
+        )
+        if not (data or {}).get("ok"):
+            raise ProviderError(PROVIDER, str((data or {}).get("error", data)), status)
+        return data["result"]
+
+    async def create_invoice(self, amount: float, description: str, payload: str,
+                             paid_btn_url: str, asset: str = "USDT") -> CryptoInvoice:
+        result = await self._call("createInvoice", "POST", json={
+            "asset": asset,
+            "amount": amount,
+            "description": description,
+            "paid_btn_name": "openBot",
+            "paid_btn_url": paid_btn_url,
+            "payload": payload,
+            "allow_anonymous": False,
+        })
+        return CryptoInvoice.from_api(result)
+
+    async def get_invoices(self, invoice_ids=None, status: Optional[str] = None,
+                           offset: int = 0, count: int = MAX_PAGE_SIZE) -> list[CryptoInvoice]:
+        """Одна страница getInvoices с фильтрами по id и статусу ("active", "paid")."""
+        params = {"offset": offset, "count": count}
+        if invoice_ids:
+            params["invoice_ids"] = ",".join(str(invoice_id) for invoice_id in invoice_ids)
+        if status:
+            params["status"] = status
+        result = await self._call("getInvoices", params=params)
+        items = result.get("items", []) if isinstance(result, dict) else result
+        return [CryptoInvoice.from_api(item) for item in items if isinstance(item, dict)]
+
+    async def get_invoices_by_ids(self, invoice_ids, batch_size: int = IDS_PER_REQUEST) -> list[CryptoInvoice]:
+        """Запрашивает только нужные инвойсы, по batch_size id за запрос."""
+        invoice_ids = [str(invoice_id) for invoice_id in invoice_ids]
+        batches = [invoice_ids[i:i + batch_size] for i in range(0, len(invoice_ids), batch_size)]
+        pages = await asyncio.gather(*(
+            self.get_invoices(invoice_ids=batch, count=len(batch)) for batch in batches
+        ))
+        return [invoice for page in pages for invoice in page]
+
+    async def get_invoice(self, invoice_id) -> Optional[CryptoInvoice]:
+        invoices = await self.get_invoices(invoice_ids=[invoice_id], count=1)
+        return invoices[0] if invoices else None
+
+
+http_client.configure(PROVIDER, config.CRYPTOBOT_TIMEOUT, config.CRYPTOBOT_CONCURRENCY)
+cryptobot = CryptoBotClient(http_client, config.CRYPTO_API_KEY, config.CRYPTOBOT_API_URL)
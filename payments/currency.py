@@ -1,15 +1,146 @@
-import requests
+import asyncio
+import logging
+import time
+from typing import Optional
+
 from config import config
+from database.db import db
+from monitoring.metrics import Gauge, registry
+from payments.http import HttpClient, ProviderError, http_client
+
+
+logger = logging.getLogger(__name__)
+
+PROVIDER = "exchange"
 
 
-EXCHANGE_API_KEY = config.EXCHANGE_API_KEY
+class ExchangeRateClient:
+    def __init__(self, http: HttpClient, api_key: str, base_url: str):
+        self.http = http
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
 
-def get_usd_exchange_rate():
-    """Получает актуальный курс USD/RUB."""
-    try:
-        response = requests.get(f"https://v6.exchangerate-api.com/v6/{EXCHANGE_API_KEY}/latest/RUB")
-        data = response.json()
+    async def get_usd_rate(self) -> float:
+        """Курс USD в рублях."""
+        status, data = await self.http.request(PROVIDER, "GET", f"{self.base_url}/{self.api_key}/latest/RUB")
+        if status != 200 or (data or {}).get("result") == "error":
+            raise ProviderError(PROVIDER, str((data or {}).get("error-type", data)), status)
         return 1 / data["conversion_rates"]["USD"]  # RUB → USD
-    except Exception as e:
-        print(f"Ошибка получения курса валют: {e}")
-        return 0.011
+
+
+class RateCache:
+    """Курс USD/RUB в памяти, обновляемый фоновой задачей.
+
+    Создание платежа берет курс отсюда и никогда не ждет API. Последний
+    полученный курс сохраняется в БД, поэтому после рестарта кэш сразу теплый.
+    API опрашивает один процесс, остальные перечитывают курс из БД.
+    """
+
+    CURRENCY = "USD"
+
+    def __init__(self, client: ExchangeRateClient, ttl: float, retry_interval: float = 60):
+        self.client = client
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.rate: Optional[float] = None
+        self.updated_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def age(self) -> Optional[float]:
+        """Возраст курса в секундах (None — курса еще не было ни разу)."""
+        if self.updated_at is None:
+            return None
+        return time.time() - self.updated_at
+
+    def get(self) -> float:
+        if self.rate is None:
+            # Платеж по выдуманному курсу хуже отказа: ждем первого курса из API или БД
+            raise ProviderError(PROVIDER, "курс валют еще не получен")
+        return self.rate
+
+    async def load(self):
+        """Поднимает последний сохраненный курс из БД."""
+        row = await db.fetchone(
+            "SELECT rate, updated_at FROM exchange_rates WHERE currency = ?", (self.CURRENCY,)
+        )
+        if row and row[1] != self.updated_at:
+            self.rate, self.updated_at = row
+            logger.info("Курс %s загружен из БД: %.4f (возраст %.0f с)", self.CURRENCY, self.rate, self.age())
+
+    async def refresh(self):
+        rate = await self.client.get_usd_rate()
+        now = time.time()
+        await db.execute('''
+            INSERT INTO exchange_rates (currency, rate, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (currency) DO UPDATE SET rate = excluded.rate, updated_at = excluded.updated_at
+        ''', (self.CURRENCY, rate, now))
+        self.rate, self.updated_at = rate, now
+        logger.debug("Курс %s обновлен: %s", self.CURRENCY, rate)
+
+    async def _run(self):
+        while True:
+            age = self.age()
+            if age is None or age >= self.ttl:
+                try:
+                    await self.refresh()
+                except (ProviderError, KeyError, ZeroDivisionError) as e:
+                    age = self.age()
+                    logger.warning(
+                        "Не удалось обновить курс валют: %s (возраст текущего курса: %s с)",
+                        e, "нет курса" if age is None else f"{age:.0f}"
+                    )
+                    await asyncio.sleep(self.retry_interval)
+                    continue
+            await asyncio.sleep(max(self.ttl - (self.age() or 0), 1))
+
+    async def _follow(self):
+        while True:
+            age = self.age()
+            if age is None or age >= self.ttl:
+                try:
+                    await self.load()
+                except Exception as e:
+                    logger.warning("Не удалось перечитать курс валют из БД: %s", e)
+            age = self.age()
+            if age is None or age >= self.ttl:
+                # Процесс с фоновыми задачами еще не обновил курс — проверим позже
+                await asyncio.sleep(self.retry_interval)
+            else:
+                await asyncio.sleep(max(self.ttl - age, 1))
+
+    def start(self, fetch: bool = True):
+        """fetch=False — не ходить в API, а только перечитывать курс, сохраненный другим процессом."""
+        if self._task is None or self._task.done():
+            if fetch:
+                self._task = asyncio.create_task(self._run(), name="exchange-rate-refresh")
+            else:
+                self._task = asyncio.create_task(self._follow(), name="exchange-rate-follow")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+http_client.configure(PROVIDER, config.EXCHANGE_TIMEOUT, config.EXCHANGE_CONCURRENCY)
+exchange_rates = ExchangeRateClient(http_client, config.EXCHANGE_API_KEY, config.EXCHANGE_API_URL)
+rate_cache = RateCache(exchange_rates, config.EXCHANGE_RATE_TTL)
+
+
+def _rate_age() -> float:
+    # Пока курса нет, пополнение через YooKassa отключено: +Inf остается
+    # в метриках, чтобы на это состояние можно было настроить алерт
+    age = rate_cache.age()
+    return float("inf") if age is None else age
+
+
+registry.register(Gauge("bot_exchange_rate_age_seconds", "Возраст курса USD/RUB в кэше (+Inf — курса нет)", _rate_age))
+
+
+def get_usd_exchange_rate() -> float:
+    """Актуальный курс USD/RUB из кэша (без обращения к API). ProviderError, если курса еще нет."""
+    return rate_cache.get()
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import aiohttp
+
+from monitoring.metrics import http_seconds
+
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderError(Exception):
+    """Ошибка внешнего API (YooKassa, CryptoBot, курс валют)."""
+
+    def __init__(self, provider: str, message: str, status: int = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status = status
+        self.message = message
+
+
+@dataclass(frozen=True)
+class ProviderLimits:
+    timeout: float
+    concurrency: int
+
+
+class HttpClient:
+    """Общий HTTP-клиент для всех платежных провайдеров.
+
+    Одна aiohttp-сессия с keep-alive на весь процесс, у каждого провайдера
+    свой таймаут и ограничение на число одновременных запросов.
+    """
+
+    def __init__(self, pool_size: int = 100, keepalive_timeout: float = 60):
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._limits: dict[str, ProviderLimits] = {}
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def configure(self, provider: str, timeout: float, concurrency: int):
+        self._limits[provider] = ProviderLimits(timeout, concurrency)
+        self._semaphores[provider] = asyncio.Semaphore(concurrency)
+
+    def _session_or_create(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def request(self, provider: str, method: str, url: str, **kwargs):
+        """Выполняет запрос и возвращает (HTTP-статус, JSON-ответ)."""
+        limits = self._limits.get(provider) or ProviderLimits(timeout=10, concurrency=10)
+        semaphore = self._semaphores.setdefault(provider, asyncio.Semaphore(limits.concurrency))
+        session = self._session_or_create()
+
+        async with semaphore:
+            # Время считаем без ожидания семафора: это задержка самого провайдера
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                async with session.request(
+                    method, url, timeout=aiohttp.ClientTimeout(total=limits.timeout), **kwargs
+                ) as response:
+                    data = await response.json(content_type=None)
+                    outcome = str(response.status)
+                    return response.status, data
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise ProviderError(provider, f"таймаут {limits.timeout} с")
+            except (aiohttp.ClientError, ValueError) as e:
+                raise ProviderError(provider, f"ошибка запроса: {e}")
+            finally:
+                http_seconds.observe(time.perf_counter() - started, provider, outcome)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+http_client = HttpClient()
@@ -0,0 +1,16 @@
+import logging
+
+from aiogram import Bot
+
+
+logger = logging.getLogger(__name__)
+
+
+async def notify_payment_credited(bot: Bot, telegram_id: int, amount_usd: float):
+    """Сообщает пользователю о зачислении пополнения."""
+    try:
+        await bot.send_message(
+            telegram_id, f"✅ Оплата на {amount_usd:.2f} USD подтверждена! Баланс пополнен."
+        )
+    except Exception as e:
+        logger.warning("Не удалось уведомить пользователя %s о зачислении: %s", telegram_id, e)
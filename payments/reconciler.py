@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from typing import Optional
+
+from aiogram import Bot
+
+from functions.functions import (
+    apply_yoo_payment_status, credit_crypto_payment, get_pending_crypto_payments,
+    get_pending_payments, set_crypto_payment_status,
+)
+from payments.cryptobot import IDS_PER_REQUEST, cryptobot
+from payments.http import ProviderError
+from payments.notifications import notify_payment_credited
+from payments.yookassa import yookassa
+
+
+logger = logging.getLogger(__name__)
+
+# Статусы, после которых платеж больше не нужно проверять
+YOO_FINAL_STATUSES = {"succeeded", "canceled"}
+CRYPTO_FINAL_STATUSES = {"paid", "expired"}
+
+
+class PaymentReconciler:
+    """Фоновая сверка ожидающих платежей YooKassa и CryptoBot.
+
+    Раз в interval секунд читает pending-платежи пачками, спрашивает
+    провайдеров о статусе (не больше concurrency запросов одновременно),
+    зачисляет оплаченное и сам уведомляет пользователя.
+    """
+
+    def __init__(self, bot: Bot, interval: float, batch_size: int = 100, concurrency: int = 5):
+        self.bot = bot
+        self.interval = interval
+        self.batch_size = batch_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _check_yoo_payment(self, payment_id: str) -> bool:
+        async with self._semaphore:
+            try:
+                payment = await yookassa.get_payment(payment_id)
+            except ProviderError as e:
+                logger.warning("Сверка: не удалось получить платеж YooKassa %s: %s", payment_id, e)
+                return False
+        status = payment.status if payment else "canceled"
+        if status not in YOO_FINAL_STATUSES:
+            return False
+        credited = await apply_yoo_payment_status(payment_id, status)
+        if credited:
+            await notify_payment_credited(self.bot, *credited)
+        return bool(credited)
+
+    async def reconcile_yookassa(self) -> int:
+        credited, after_id = 0, 0
+        while True:
+            rows = await get_pending_payments(after_id, self.batch_size)
+            if not rows:
+                return credited
+            after_id = rows[-1][0]
+            results = await asyncio.gather(*(self._check_yoo_payment(payment_id) for _, payment_id in rows))
+            credited += sum(results)
+
+    async def _apply_invoice(self, invoice) -> bool:
+        if invoice.status == "paid":
+            credited = await credit_crypto_payment(invoice.invoice_id)
+            if credited:
+                await notify_payment_credited(self.bot, *credited)
+            return bool(credited)
+        if invoice.status in CRYPTO_FINAL_STATUSES:
+            await set_crypto_payment_status(invoice.invoice_id, invoice.status)
+        return False
+
+    async def reconcile_cryptobot(self) -> int:
+        credited, after_id = 0, 0
+        while True:
+            rows = await get_pending_crypto_payments(after_id, IDS_PER_REQUEST)
+            if not rows:
+                return credited
+            after_id = rows[-1][0]
+            # Одним запросом забираем статусы всей пачки, а не весь список инвойсов аккаунта
+            async with self._semaphore:
+                try:
+                    invoices = await cryptobot.get_invoices_by_ids([invoice_id for _, invoice_id in rows])
+                except ProviderError as e:
+                    logger.warning("Сверка: не удалось получить инвойсы CryptoBot: %s", e)
+                    return credited
+            results = await asyncio.gather(*(self._apply_invoice(invoice) for invoice in invoices))
+            credited += sum(results)
+
+    async def run_once(self):
+        yoo_credited, crypto_credited = await asyncio.gather(
+            self.reconcile_yookassa(), self.reconcile_cryptobot()
+        )
+        if yoo_credited or crypto_credited:
+            logger.info("Сверка платежей: зачислено YooKassa %d, CryptoBot %d", yoo_credited, crypto_credited)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Ошибка сверки платежей")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="payment-reconciler")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,70 @@
+import logging
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+
+import aiohttp
+
+from config import config
+from payments.http import HttpClient, ProviderError, http_client
+
+
+logger = logging.getLogger(__name__)
+
+PROVIDER = "yookassa"
+
+
+@dataclass
+class YooPayment:
+    id: str
+    status: str
+    confirmation_url: Optional[str] = None
+    metadata: dict = field(default_factory=dict)
+
+    @classmethod
+    def from_api(cls, data: dict) -> "YooPayment":
+        return cls(
+            id=data["id"],
+            status=data.get("status"),
+            confirmation_url=(data.get("confirmation") or {}).get("confirmation_url"),
+            metadata=data.get("metadata") or {},
+        )
+
+
+class YooKassaClient:
+    def __init__(self, http: HttpClient, shop_id: str, secret_key: str, base_url: str):
+        self.http = http
+        self.base_url = base_url.rstrip("/")
+        self._auth = aiohttp.BasicAuth(shop_id or "", secret_key or "")
+
+    async def create_payment(self, amount_rub: float, description: str, metadata: dict, return_url: str) -> YooPayment:
+        data = {
+            "amount": {"value": f"{amount_rub:.2f}", "currency": "RUB"},
+            "confirmation": {"type": "redirect", "return_url": return_url},
+            "capture": True,
+            "description": description,
+            "metadata": metadata,
+        }
+        headers = {"Idempotence-Key": str(uuid.uuid4())}
+        status, body = await self.http.request(
+            PROVIDER, "POST", f"{self.base_url}/payments", json=data, headers=headers, auth=self._auth
+        )
+        logger.debug("Ответ YooKassa (%s): %s", status, body)
+        if status not in (200, 201):
+            raise ProviderError(PROVIDER, (body or {}).get("description", "Неизвестная ошибка"), status)
+        return YooPayment.from_api(body)
+
+    async def get_payment(self, payment_id: str) -> Optional[YooPayment]:
+        """Возвращает платеж или None, если YooKassa его не знает."""
+        status, body = await self.http.request(
+            PROVIDER, "GET", f"{self.base_url}/payments/{payment_id}", auth=self._auth
+        )
+        if status == 404:
+            return None
+        if status != 200:
+            raise ProviderError(PROVIDER, (body or {}).get("description", "Неизвестная ошибка"), status)
+        return YooPayment.from_api(body)
+
+
+http_client.configure(PROVIDER, config.YOOKASSA_TIMEOUT, config.YOOKASSA_CONCURRENCY)
+yookassa = YooKassaClient(http_client, config.YOOKASSA_SHOP_ID, config.YOOKASSA_SECRET_KEY, config.YOOKASSA_API_URL)
@@ -7,6 +7,7 @@ class FSMStates(StatesGroup):
     waiting_for_balance_update = State()  # Ожидание ввода нового баланса пользователя
     waiting_for_user_id_balance = State()  # Ожидание ввода ID пользователя и баланса
     waiting_for_product_id = State() # Ожидание ввода ID товара
+    waiting_for_delete_confirm = State()  # Ожидание подтверждения удаления товаров
     get_promo = State()
     waiting_for_promo_code = State()
     waiting_for_broadcast = State()
@@ -0,0 +1,297 @@
+"""Многопроцессный режим: supervisor получает апдейты и раздает их воркерам.
+
+Апдейт попадает к воркеру по from_user.id, поэтому все апдейты одного
+пользователя обрабатывает один процесс и в порядке поступления. Воркеры
+делят SQLite (WAL), FSM-хранилище и кэш каталога синхронизируются через БД.
+
+Запуск: python supervisor.py (число воркеров — SUPERVISOR_WORKERS).
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue
+import signal
+import time
+from collections import defaultdict
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+
+from config import config
+from database.db import db
+from database.migrations import migrate
+from main import create_app
+from monitoring.log import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30
+MAX_BACKOFF = 30
+
+
+def update_user_id(update: dict) -> Optional[int]:
+    """id пользователя, от которого пришел апдейт (message, callback_query и т.д.)."""
+    for key, value in update.items():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("user")
+            if isinstance(sender, dict) and "id" in sender:
+                return sender["id"]
+    return None
+
+
+# --- Воркер ---
+
+class ShardWorker:
+    """Обрабатывает апдейты своей доли пользователей.
+
+    Апдейты разных пользователей идут параллельно, одного — строго по очереди.
+    """
+
+    def __init__(self, worker_id: int, updates, heartbeat):
+        self.worker_id = worker_id
+        self.updates = updates
+        self.heartbeat = heartbeat
+        self.bot: Optional[Bot] = None
+        self.dp: Optional[Dispatcher] = None
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._pending = defaultdict(int)
+        self._tasks: set[asyncio.Task] = set()
+
+    async def _beat(self):
+        # Если цикл событий завис, метка перестанет обновляться и supervisor перезапустит воркер
+        while True:
+            self.heartbeat.value = time.time()
+            await asyncio.sleep(1)
+
+    async def _handle(self, user_id: int, raw: str):
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        self._pending[user_id] += 1
+        try:
+            async with lock:
+                await self.dp.feed_raw_update(self.bot, json.loads(raw))
+        except Exception as e:
+            logger.error("Воркер %s: ошибка обработки апдейта: %s", self.worker_id, e)
+        finally:
+            self._pending[user_id] -= 1
+            if not self._pending[user_id]:
+                del self._pending[user_id]
+                del self._locks[user_id]
+
+    async def run(self):
+        self.bot, self.dp = create_app(background_tasks=self.worker_id == 0, worker_id=self.worker_id)
+        workflow_data = {"dispatcher": self.dp, "bots": [self.bot], "bot": self.bot, **self.dp.workflow_data}
+        await self.dp.emit_startup(**workflow_data)
+
+        payments_server = None
+        if config.PAYMENT_WEBHOOKS and self.worker_id == 0:
+            from webhooks.app import start_payments_server
+
+            payments_server = await start_payments_server(self.bot)
+
+        beat = asyncio.create_task(self._beat())
+        logger.info("Воркер %s запущен", self.worker_id)
+        try:
+            while True:
+                item = await asyncio.to_thread(self.updates.get)
+                if item is None:
+                    break
+                task = asyncio.create_task(self._handle(*item))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+        finally:
+            beat.cancel()
+            if payments_server is not None:
+                await payments_server.cleanup()
+            await self.dp.emit_shutdown(**workflow_data)
+            await self.bot.session.close()
+            logger.info("Воркер %s остановлен", self.worker_id)
+
+
+def run_worker(worker_id: int, updates, heartbeat):
+    # Ctrl+C обрабатывает supervisor и останавливает воркеры сам
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging()
+    asyncio.run(ShardWorker(worker_id, updates, heartbeat).run())
+
+
+# --- Supervisor ---
+
+DRAIN_WAIT = 0.1
+
+
+def drain_queue(updates) -> list:
+    """Апдейты, оставшиеся в очереди остановленного воркера.
+
+    Если воркер был убит, пока ждал в get(), блокировка чтения очереди
+    осталась за ним и прочитать остаток нельзя — тогда он только считается.
+    """
+    items = []
+    while True:
+        try:
+            # Короткое ожидание: фоновый поток очереди дописывает в канал свой буфер
+            items.append(updates.get(timeout=DRAIN_WAIT))
+        except queue.Empty:
+            break
+    if not updates.empty():
+        try:
+            lost = updates.qsize()
+        except NotImplementedError:
+            lost = "?"
+        logger.error("Очередь воркера заблокирована, потеряно апдейтов: %s", lost)
+    return items
+
+
+class WorkerSlot:
+    def __init__(self, worker_id: int, context):
+        self.worker_id = worker_id
+        self.context = context
+        self.process = None
+        self.updates = None
+        self.heartbeat = context.Value("d", 0.0, lock=False)
+        self.restarts = 0
+
+    def start(self):
+        # Очередь каждый раз новая: убитый процесс мог оставить блокировку чтения старой.
+        # Апдейты из старой очереди Telegram уже подтвердил (offset), поэтому их
+        # переносим в новую, иначе они потеряются. При перезапуске метод
+        # выполняется в отдельном потоке, пока supervisor продолжает раздавать апдейты
+        old = self.updates
+        updates = self.context.Queue()
+        moved = 0
+        if old is not None:
+            pending = drain_queue(old)
+            for item in pending:
+                updates.put(item)
+            # Новые апдейты идут уже в новую очередь; дочитываем те,
+            # что успели попасть в старую, пока ее разбирали
+            self.updates = updates
+            late = drain_queue(old)
+            for item in late:
+                updates.put(item)
+            moved = len(pending) + len(late)
+            old.cancel_join_thread()
+            old.close()
+        self.updates = updates
+        if moved:
+            logger.warning("Воркер %s: %d апдейтов перенесено из старой очереди", self.worker_id, moved)
+        self.heartbeat.value = time.time()
+        self.process = self.context.Process(
+            target=run_worker,
+            args=(self.worker_id, self.updates, self.heartbeat),
+            name=f"worker-{self.worker_id}",
+        )
+        self.process.start()
+
+    def is_healthy(self, timeout: float) -> bool:
+        return self.process.is_alive() and time.time() - self.heartbeat.value < timeout
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+
+
+class Supervisor:
+    def __init__(self, workers: int):
+        self.context = multiprocessing.get_context("spawn")
+        self.slots = [WorkerSlot(worker_id, self.context) for worker_id in range(workers)]
+        self._stopping = asyncio.Event()
+        self._offset: Optional[int] = None
+
+    def route(self, update: dict):
+        user_id = update_user_id(update)
+        if user_id is None:
+            user_id = update["update_id"]
+        slot = self.slots[user_id % len(self.slots)]
+        slot.updates.put((user_id, json.dumps(update)))
+
+    async def _health_check(self):
+        while not self._stopping.is_set():
+            await asyncio.sleep(config.SUPERVISOR_HEALTH_INTERVAL)
+            for slot in self.slots:
+                if self._stopping.is_set() or slot.is_healthy(config.SUPERVISOR_HEARTBEAT_TIMEOUT):
+                    continue
+                logger.error(
+                    "Воркер %s не отвечает (код выхода %s), перезапуск", slot.worker_id, slot.process.exitcode
+                )
+                await asyncio.to_thread(slot.kill)
+                slot.restarts += 1
+                await asyncio.to_thread(slot.start)
+
+    async def _poll(self, bot: Bot, allowed_updates):
+        offset = self._offset
+        backoff = 1
+        while not self._stopping.is_set():
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates,
+                    request_timeout=POLL_TIMEOUT + 10,
+                )
+            except Exception as e:
+                logger.error("Ошибка получения апдейтов: %s, повтор через %s с", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+            backoff = 1
+            for update in updates:
+                self.route(update.model_dump(mode="json", by_alias=True, exclude_unset=True))
+                offset = update.update_id + 1
+                self._offset = offset
+
+    async def run(self):
+        # Миграции — один раз до старта воркеров
+        await migrate(db)
+        await db.close()
+
+        bot, dp = create_app()
+        allowed_updates = dp.resolve_used_update_types()
+        await bot.delete_webhook()
+
+        for slot in self.slots:
+            slot.start()
+        logger.info("Supervisor запустил воркеров: %s", len(self.slots))
+
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stopping.set)
+
+        poller = asyncio.create_task(self._poll(bot, allowed_updates))
+        health = asyncio.create_task(self._health_check())
+        try:
+            await self._stopping.wait()
+        finally:
+            poller.cancel()
+            health.cancel()
+            await asyncio.gather(poller, health, return_exceptions=True)
+            if self._offset is not None:
+                # Подтверждаем последние розданные апдейты, чтобы Telegram не прислал их снова
+                try:
+                    await bot.get_updates(offset=self._offset, timeout=0, limit=1)
+                except Exception as e:
+                    logger.warning("Не удалось подтвердить последние апдейты: %s", e)
+            await bot.session.close()
+            await asyncio.to_thread(self.stop_workers)
+
+    def stop_workers(self):
+        for slot in self.slots:
+            slot.updates.put(None)
+        for slot in self.slots:
+            slot.process.join(30)
+            slot.kill()
+        logger.info("Все воркеры остановлены")
+
+
+def main():
+    setup_logging()
+    asyncio.run(Supervisor(config.SUPERVISOR_WORKERS).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,13 @@
+import os
+
+
+# Конфиг читается при импорте, поэтому окружение выставляется до импорта бота
+for name, value in {
+    "BOT_TOKEN": "123456:test",
+    "ADMIN_IDS": "",
+    "YOOKASSA_SHOP_ID": "test",
+    "YOOKASSA_SECRET_KEY": "test",
+    "CRYPTO_API_KEY": "test",
+    "EXCHANGE_API_KEY": "test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,101 @@
+import asyncio
+import hashlib
+import hmac
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer, make_mocked_request
+
+from config import config
+from webhooks import payments
+
+
+YOOKASSA_IP = "185.71.76.1"
+
+
+def _request(*headers):
+    return make_mocked_request("POST", config.YOOKASSA_WEBHOOK_PATH, headers=list(headers))
+
+
+def test_client_ip_takes_last_forwarded_hop(monkeypatch):
+    monkeypatch.setattr(config, "WEBHOOK_TRUST_PROXY", True)
+    monkeypatch.setattr(config, "WEBHOOK_PROXY_IP_HEADER", "X-Forwarded-For")
+    # Клиент прислал адрес YooKassa сам, прокси дописал настоящий
+    request = _request(("X-Forwarded-For", f"{YOOKASSA_IP}, 6.6.6.6"))
+    assert payments._client_ip(request) == "6.6.6.6"
+    # Прокси добавил свой заголовок отдельной строкой
+    request = _request(("X-Forwarded-For", YOOKASSA_IP), ("X-Forwarded-For", "6.6.6.6"))
+    assert payments._client_ip(request) == "6.6.6.6"
+
+
+def test_client_ip_real_ip_header(monkeypatch):
+    monkeypatch.setattr(config, "WEBHOOK_TRUST_PROXY", True)
+    monkeypatch.setattr(config, "WEBHOOK_PROXY_IP_HEADER", "X-Real-IP")
+    request = _request(("X-Forwarded-For", YOOKASSA_IP), ("X-Real-IP", "6.6.6.6"))
+    assert payments._client_ip(request) == "6.6.6.6"
+
+
+def test_client_ip_ignores_headers_without_proxy(monkeypatch):
+    monkeypatch.setattr(config, "WEBHOOK_TRUST_PROXY", False)
+    request = _request(("X-Forwarded-For", YOOKASSA_IP))
+    assert payments._client_ip(request) != YOOKASSA_IP
+
+
+def test_forged_forwarded_for_is_rejected(monkeypatch):
+    monkeypatch.setattr(config, "WEBHOOK_TRUST_PROXY", True)
+    monkeypatch.setattr(config, "WEBHOOK_PROXY_IP_HEADER", "X-Forwarded-For")
+    monkeypatch.setattr(config, "YOOKASSA_WEBHOOK_REFETCH", False)
+    credited = []
+
+    async def apply_status(payment_id, status):
+        credited.append((payment_id, status))
+
+    monkeypatch.setattr(payments, "apply_yoo_payment_status", apply_status)
+
+    async def post():
+        app = web.Application()
+        app.router.add_post(config.YOOKASSA_WEBHOOK_PATH, payments.yookassa_notification)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(
+                config.YOOKASSA_WEBHOOK_PATH,
+                json={"object": {"id": "pay-1", "status": "succeeded"}},
+                headers={"X-Forwarded-For": f"{YOOKASSA_IP}, 6.6.6.6"},
+            )
+            return response.status
+
+    assert asyncio.run(post()) == 403
+    assert credited == []
+
+
+def _sign(body: bytes, token: str) -> str:
+    return hmac.new(hashlib.sha256(token.encode()).digest(), body, hashlib.sha256).hexdigest()
+
+
+def test_cryptobot_signature_requires_token():
+    body = b'{"update_type": "invoice_paid", "payload": {"invoice_id": 1}}'
+    assert not payments.verify_cryptobot_signature(body, _sign(body, ""), "")
+
+
+def test_cryptobot_route_not_mounted_without_token(monkeypatch):
+    monkeypatch.setattr(config, "CRYPTO_API_KEY", "")
+    app = web.Application()
+    payments.register_payment_routes(app, None)
+    paths = {resource.canonical for resource in app.router.resources()}
+    assert config.CRYPTOBOT_WEBHOOK_PATH not in paths
+    assert config.YOOKASSA_WEBHOOK_PATH in paths
+
+
+def test_cryptobot_update_without_payload_is_rejected(monkeypatch):
+    monkeypatch.setattr(config, "CRYPTO_API_KEY", "token")
+    body = b'{"update_type": "invoice_paid"}'
+
+    async def post():
+        app = web.Application()
+        app.router.add_post(config.CRYPTOBOT_WEBHOOK_PATH, payments.cryptobot_update)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(
+                config.CRYPTOBOT_WEBHOOK_PATH, data=body,
+                headers={"crypto-pay-api-signature": _sign(body, "token")},
+            )
+            return response.status
+
+    assert asyncio.run(post()) == 400
@@ -0,0 +1,60 @@
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import config
+from webhooks.payments import register_payment_routes
+
+
+logger = logging.getLogger(__name__)
+
+
+def _webhook_secret() -> str:
+    # Без секрета любой, кто узнал путь вебхука, может прислать апдейт
+    # от имени администратора, поэтому без него режим webhook не запускается
+    if not config.WEBHOOK_SECRET:
+        raise RuntimeError("Для режима webhook нужен WEBHOOK_SECRET")
+    return config.WEBHOOK_SECRET
+
+
+def build_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """aiohttp-приложение, принимающее апдейты Telegram по вебхуку."""
+    app = web.Application()
+
+    # Telegram присылает секрет в X-Telegram-Bot-Api-Secret-Token,
+    # запросы без него или с чужим секретом получают 401
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=_webhook_secret(),
+    ).register(app, path=config.WEBHOOK_PATH)
+
+    if config.PAYMENT_WEBHOOKS:
+        register_payment_routes(app, bot)
+
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def start_payments_server(bot: Bot) -> web.AppRunner:
+    """Отдельный сервер только для уведомлений о платежах (режим polling)."""
+    app = web.Application()
+    register_payment_routes(app, bot)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, config.WEBHOOK_HOST, config.WEBHOOK_PORT).start()
+    logger.info("Уведомления о платежах принимаются на %s:%d", config.WEBHOOK_HOST, config.WEBHOOK_PORT)
+    return runner
+
+
+async def set_webhook(bot: Bot, dp: Dispatcher):
+    secret = _webhook_secret()
+    url = config.WEBHOOK_BASE_URL.rstrip("/") + config.WEBHOOK_PATH
+    await bot.set_webhook(
+        url,
+        secret_token=secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info("Вебхук установлен: %s", url)
@@ -0,0 +1,111 @@
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+
+from aiogram import Bot
+from aiohttp import web
+
+from config import config
+from functions.functions import apply_yoo_payment_status, credit_crypto_payment
+from payments.http import ProviderError
+from payments.notifications import notify_payment_credited
+from payments.yookassa import yookassa
+
+
+logger = logging.getLogger(__name__)
+
+BOT_KEY = web.AppKey("payments_bot", Bot)
+
+
+def _client_ip(request: web.Request) -> str:
+    if config.WEBHOOK_TRUST_PROXY:
+        # Прокси дописывает адрес клиента в конец X-Forwarded-For. Все, что левее,
+        # прислал сам клиент, поэтому верим только последнему адресу
+        # (для X-Real-IP, который прокси перезаписывает, это единственное значение)
+        values = request.headers.getall(config.WEBHOOK_PROXY_IP_HEADER, [])
+        hop = ",".join(values).rsplit(",", 1)[-1].strip()
+        if hop:
+            return hop
+    return request.remote or ""
+
+
+def _ip_allowed(ip: str) -> bool:
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return False
+    return any(address in network for network in config.yookassa_webhook_networks)
+
+
+def verify_cryptobot_signature(body: bytes, signature: str, token: str) -> bool:
+    """Подпись CryptoBot: HMAC-SHA256 тела запроса, ключ — SHA256 от токена API."""
+    if not token:
+        # Ключ от пустого токена известен всем — такую подпись подделает кто угодно
+        return False
+    secret = hashlib.sha256(token.encode()).digest()
+    expected = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature or "")
+
+
+async def yookassa_notification(request: web.Request) -> web.Response:
+    try:
+        notification = await request.json()
+        payment = notification["object"]
+        payment_id = payment["id"]
+    except (ValueError, KeyError, TypeError):
+        return web.Response(status=400)
+
+    if _ip_allowed(_client_ip(request)):
+        status = payment.get("status")
+    elif config.YOOKASSA_WEBHOOK_REFETCH:
+        # Источник неизвестен — статусу из тела не верим, спрашиваем YooKassa сами
+        try:
+            fetched = await yookassa.get_payment(payment_id)
+        except ProviderError as e:
+            logger.warning("Уведомление YooKassa %s: не удалось перепроверить платеж: %s", payment_id, e)
+            return web.Response(status=503)
+        if fetched is None:
+            return web.Response(status=404)
+        status = fetched.status
+    else:
+        logger.warning("Уведомление YooKassa с неразрешенного адреса %s отклонено", _client_ip(request))
+        return web.Response(status=403)
+
+    credited = await apply_yoo_payment_status(payment_id, status)
+    if credited:
+        await notify_payment_credited(request.app[BOT_KEY], *credited)
+    return web.Response(status=200)
+
+
+async def cryptobot_update(request: web.Request) -> web.Response:
+    body = await request.read()
+    signature = request.headers.get("crypto-pay-api-signature", "")
+    if not verify_cryptobot_signature(body, signature, config.CRYPTO_API_KEY):
+        logger.warning("Обновление CryptoBot с неверной подписью отклонено")
+        return web.Response(status=401)
+
+    try:
+        update = json.loads(body)
+        update_type = update.get("update_type")
+        if update_type == "invoice_paid":
+            invoice_id = str(update["payload"]["invoice_id"])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return web.Response(status=400)
+
+    if update_type == "invoice_paid":
+        credited = await credit_crypto_payment(invoice_id)
+        if credited:
+            await notify_payment_credited(request.app[BOT_KEY], *credited)
+    return web.Response(status=200)
+
+
+def register_payment_routes(app: web.Application, bot: Bot):
+    app[BOT_KEY] = bot
+    app.router.add_post(config.YOOKASSA_WEBHOOK_PATH, yookassa_notification)
+    if config.CRYPTO_API_KEY:
+        app.router.add_post(config.CRYPTOBOT_WEBHOOK_PATH, cryptobot_update)
+    else:
+        # Без токена подпись CryptoBot проверить нечем — маршрут не поднимаем
+        logger.warning("CRYPTO_API_KEY не задан, уведомления CryptoBot не принимаются")
@@ -0,0 +1,63 @@
+"""Локальный отправитель уведомлений о платежах для проверки вебхуков.
+
+    python -m webhooks.stub_sender cryptobot <invoice_id>
+    python -m webhooks.stub_sender yookassa <payment_id> --status succeeded
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import time
+
+import aiohttp
+
+from config import config
+
+
+def cryptobot_request(invoice_id: str, token: str):
+    body = json.dumps({
+        "update_id": int(time.time()),
+        "update_type": "invoice_paid",
+        "request_date": time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+        "payload": {"invoice_id": int(invoice_id), "status": "paid"},
+    }).encode()
+    secret = hashlib.sha256(token.encode()).digest()
+    signature = hmac.new(secret, body, hashlib.sha256).hexdigest()
+    return body, {"Content-Type": "application/json", "crypto-pay-api-signature": signature}
+
+
+def yookassa_request(payment_id: str, status: str):
+    body = json.dumps({
+        "type": "notification",
+        "event": f"payment.{status}",
+        "object": {"id": payment_id, "status": status},
+    }).encode()
+    return body, {"Content-Type": "application/json"}
+
+
+async def send(url: str, body: bytes, headers: dict):
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, data=body, headers=headers) as response:
+            print(response.status, await response.text())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("provider", choices=["cryptobot", "yookassa"])
+    parser.add_argument("id", help="invoice_id CryptoBot или payment_id YooKassa")
+    parser.add_argument("--status", default="succeeded", help="статус платежа YooKassa")
+    parser.add_argument("--base-url", default=f"http://{config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}")
+    args = parser.parse_args()
+
+    if args.provider == "cryptobot":
+        body, headers = cryptobot_request(args.id, config.CRYPTO_API_KEY or "")
+        url = args.base_url + config.CRYPTOBOT_WEBHOOK_PATH
+    else:
+        body, headers = yookassa_request(args.id, args.status)
+        url = args.base_url + config.YOOKASSA_WEBHOOK_PATH
+    asyncio.run(send(url, body, headers))
+
+
+if __name__ == "__main__":
+    main()